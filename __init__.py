@@ -1 +1 @@
-from .landscapes import landscape
+from .landscapes import landscape, lazy_landscape
@@ -0,0 +1,237 @@
+import copy
+import numpy as np
+from . import precision, rankings, scalings
+from .mc_sampling import (
+    TransitionSampler, _select_states, incremental_msm)
+from enspara.msm import builders, MSM
+from functools import partial
+
+
+def _scale_rows(scaling, values):
+    """Applies a scaling object to each row of `values` separately,
+    ignoring `nan` entries (undiscovered states)."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if type(scaling) is scalings.feature_scale:
+            mins = np.nanmin(values, axis=1, keepdims=True)
+            maxs = np.nanmax(values, axis=1, keepdims=True)
+            if scaling.maximize:
+                return (values - mins) / (maxs - mins)
+            return (maxs - values) / (maxs - mins)
+        if type(scaling) is scalings.sigmoid_scale:
+            sigma = np.nanmedian(values, axis=1, keepdims=True)
+            sig_scale = (1 + ((values/sigma)**scaling.a))**-1
+            if scaling.maximize:
+                sig_scale = 1 - sig_scale
+            return sig_scale
+    # unknown scalings are applied one row at a time
+    scaled_values = np.zeros(values.shape) + np.nan
+    for row, row_values in enumerate(values):
+        iis = np.where(~np.isnan(row_values))[0]
+        scaled_values[row, iis] = scaling.scale(row_values[iis])
+    return scaled_values
+
+
+def _is_batched(ranking_obj):
+    """Whether states can be selected for every rep at once with this
+    ranking object. This is the case for evens, counts, and FAST with a
+    counts statistical component, without spreading."""
+    if type(ranking_obj) is rankings.evens:
+        return True
+    if type(ranking_obj) not in [rankings.counts, rankings.FAST]:
+        return False
+    if (ranking_obj.state_centers is not None) and \
+            (ranking_obj.distance_metric is not None):
+        return False
+    if type(ranking_obj) is rankings.FAST:
+        return (ranking_obj.statistical_component is None) or \
+            (type(ranking_obj.statistical_component) is rankings.counts)
+    return True
+
+
+def _batched_rank(ranking_obj, state_counts, discovered):
+    """Ranks the states of every rep. Undiscovered states are `nan`.
+
+    Parameters
+    ----------
+    ranking_obj : rankings.counts or rankings.FAST object
+        The ranking object.
+    state_counts : array, shape=(n_reps, n_states)
+        The number of transitions observed out of each state.
+    discovered : array, shape=(n_reps, n_states)
+        Whether each state has been discovered.
+
+    Returns
+    ----------
+    rankings : array, shape=(n_reps, n_states)
+        The ranking of each state.
+    """
+    if type(ranking_obj) is rankings.counts:
+        counts_per_state = np.where(discovered, state_counts, np.nan)
+        if ranking_obj.scaling is not None:
+            counts_per_state = _scale_rows(
+                ranking_obj.scaling, counts_per_state)
+        return counts_per_state
+    # FAST
+    if ranking_obj.statistical_component is None:
+        statistical_weights = np.where(discovered, 0., np.nan)
+    else:
+        statistical_ranking = _batched_rank(
+            ranking_obj.statistical_component, state_counts, discovered)
+        statistical_weights = _scale_rows(
+            ranking_obj.statistical_scaling, statistical_ranking)
+    directed_weights = _scale_rows(
+        ranking_obj.directed_scaling,
+        np.where(
+            discovered, np.asarray(ranking_obj.state_rankings)[None, :],
+            np.nan))
+    if ranking_obj.alpha_percent:
+        return (1-ranking_obj.alpha)*directed_weights + \
+            ranking_obj.alpha*statistical_weights
+    return directed_weights + ranking_obj.alpha*statistical_weights
+
+
+def _batched_select_states(ranking_obj, state_counts, n_clones, rng):
+    """Selects `n_clones` states for every rep, following
+    rankings.base_ranking.select_states: reps with fewer discovered (or
+    ranked) states than clones pick among them evenly, and the others
+    pick the best ranked states. Ties are broken randomly, by sorting
+    on a random key after the rankings."""
+    discovered = state_counts > 0
+    if type(ranking_obj) is rankings.evens:
+        ranks = np.zeros(state_counts.shape)
+        use_evens = np.ones(len(state_counts), dtype=bool)
+        maximize = True
+    else:
+        ranks = _batched_rank(ranking_obj, state_counts, discovered)
+        use_evens = np.zeros(len(state_counts), dtype=bool)
+        maximize = ranking_obj.maximize_ranking
+    ranked = discovered * ~np.isnan(ranks)
+    # the states each rep picks from
+    pool = np.copy(ranked)
+    few_discovered = discovered.sum(axis=1) < n_clones
+    pool[few_discovered] = discovered[few_discovered]
+    use_evens += few_discovered + (ranked.sum(axis=1) < n_clones)
+    # reps without any ranked state fall back to the discovered states
+    empty = pool.sum(axis=1) == 0
+    pool[empty] = discovered[empty]
+    if maximize:
+        keys = -ranks
+    else:
+        keys = np.array(ranks)
+    # evens treats every state in the pool as a tie
+    keys[use_evens] = 0
+    keys[~pool] = np.inf
+    order = np.lexsort((rng.random(keys.shape), keys), axis=-1)
+    # reps with at least n_clones states take the first n_clones. Reps
+    # picking evenly cycle through their randomly ordered states, so
+    # every state is picked n_clones // n_pool times and the remainder
+    # is a random subset.
+    slots = np.arange(n_clones)[None, :] % pool.sum(axis=1)[:, None]
+    return np.take_along_axis(order, slots, axis=1)
+
+
+def batched_adaptive_sampling(
+        T, initial_state=0, n_runs=1, n_clones=1, n_steps=1,
+        msm_obj=None, ranking_obj=None, n_reps=1, seed=None,
+        skip_self=False, output=None):
+    """Adaptive sampling with every rep advanced together. The
+    trajectories of all reps and clones in a round are generated at
+    once, and the number of transitions out of each state is kept for
+    every rep in one (n_reps, n_states) array, so that evens, counts
+    and FAST rankings select states for every rep with array
+    operations. This avoids the per-rep overhead of adaptive_sampling
+    when there are many small reps. Other ranking objects are supported
+    by fitting an incremental_msm per rep, which is slower.
+
+    The output has the same distribution as adaptive_sampling, but the
+    random numbers are drawn in a different order, so the two do not
+    give identical assignments for the same seed.
+
+    Parameters
+    ----------
+    T : array, sparse matrix, or TransitionSampler
+        The transition probability matrix from which to sample.
+    initial_state : int, default=0
+        The initial state from which to start simulations.
+    n_runs : int, default=1
+        The number of rounds of adaptive sampling.
+    n_clones : int, default=1
+        The number of clones per run of adaptive sampling.
+    n_steps : int, default=1
+        The number of steps per clone (each trajectory).
+    msm_obj : enspara.msm.MSM object, default=None
+        Provides the lag time at which transitions are counted, and the
+        method used by ranking objects that need a full MSM.
+    ranking_obj : rankings object, default=None
+        The ranking object. Defaults to rankings.counts.
+    n_reps : int, default=1
+        The number of repetitions of adaptive sampling to perform.
+    seed : int or numpy.random.SeedSequence, default=None
+        The seed of the random number generator.
+    skip_self : bool, default=False
+        Optionally skip over self-transitions by drawing the length of
+        each dwell from a geometric distribution.
+    output : str, default=None
+        Optionally write the assignments to this .npy file instead of
+        holding them in memory.
+
+    Returns
+    ----------
+    assignments : array, shape=(n_reps, n_runs, n_clones, n_steps)
+       The assignments files for adaptive sampling runs.
+    """
+    if isinstance(T, TransitionSampler):
+        sampler = T
+    else:
+        sampler = TransitionSampler(T)
+    if skip_self:
+        sampler.exit_tables()
+    n_states = sampler.n_states
+    if msm_obj is None:
+        builder_obj = partial(builders.normalize, calculate_eq_probs=False)
+        msm_obj = MSM(lag_time=1, method=builder_obj, max_n_states=n_states)
+    msm_obj.max_n_states = n_states
+    lag_time = msm_obj.lag_time
+    if ranking_obj is None:
+        ranking_obj = rankings.counts()
+    rng = np.random.default_rng(seed)
+    shape = (n_reps, n_runs, n_clones, n_steps + 1)
+    state_dtype = precision.get_state_dtype(n_states)
+    if output is None:
+        assignments = np.zeros(shape, dtype=state_dtype)
+    else:
+        assignments = np.lib.format.open_memmap(
+            output, mode='w+', dtype=state_dtype, shape=shape)
+    batched = _is_batched(ranking_obj)
+    if batched:
+        state_counts = np.zeros((n_reps, n_states), dtype=np.int64)
+        # offset of each rep in the flattened state counts
+        rep_offsets = (np.arange(n_reps) * n_states)[:, None, None]
+    else:
+        msms = [
+            incremental_msm(copy.deepcopy(msm_obj)) for rep in range(n_reps)]
+        ranking_objs = [
+            copy.deepcopy(ranking_obj) for rep in range(n_reps)]
+    start_states = np.repeat(initial_state, n_reps * n_clones)
+    for run_num in range(n_runs):
+        if (run_num > 0) and batched:
+            start_states = _batched_select_states(
+                ranking_obj, state_counts, n_clones, rng).flatten()
+        elif run_num > 0:
+            for rep in range(n_reps):
+                msms[rep].partial_fit(assignments[rep, run_num-1])
+                states_to_simulate = _select_states(
+                    ranking_objs[rep], msms[rep], n_clones, rng)
+                start_states[rep*n_clones:(rep+1)*n_clones] = \
+                    states_to_simulate[:n_clones]
+        trajs = sampler.trajs(
+            n_steps + 1, start_states, rng=rng, skip_self=skip_self)
+        trajs = trajs.reshape((n_reps, n_clones, n_steps + 1))
+        assignments[:, run_num] = trajs
+        if batched:
+            state_counts += np.bincount(
+                (rep_offsets + trajs[:, :, :-lag_time]).flatten(),
+                minlength=n_reps * n_states).reshape((n_reps, n_states))
+    if output is not None:
+        assignments.flush()
+    return assignments
@@ -0,0 +1,166 @@
+import collections
+import hashlib
+import numpy as np
+import os
+import scipy.sparse as spar
+import shutil
+import tempfile
+
+_default_cache = None
+
+
+def set_default_cache(cache):
+    """Sets the cache used by landscape.to_probs when no cache is passed.
+    Use None to disable caching."""
+    global _default_cache
+    _default_cache = cache
+
+
+def get_default_cache():
+    return _default_cache
+
+
+def probs_key(x1s, x2s, surface, grid_size, adjust_centers=True, **kwargs):
+    """A content hash of everything that determines the output of
+    landscapes.surface_to_probs. Extra keyword arguments (i.e. `sparse`)
+    are included in the key."""
+    h = hashlib.sha256()
+    for array in [x1s, x2s, surface]:
+        array = np.ascontiguousarray(array)
+        h.update(str((array.shape, array.dtype.str)).encode())
+        h.update(array.data)
+    h.update(str(tuple(int(g) for g in grid_size)).encode())
+    h.update(str(bool(adjust_centers)).encode())
+    h.update(str(sorted(kwargs.items())).encode())
+    return h.hexdigest()
+
+
+def _nbytes(T):
+    if spar.issparse(T):
+        return T.data.nbytes + T.indices.nbytes + T.indptr.nbytes
+    return T.nbytes
+
+
+def _read_only(T):
+    if spar.issparse(T):
+        for array in [T.data, T.indices, T.indptr]:
+            array.flags.writeable = False
+    else:
+        T = T.view()
+        T.flags.writeable = False
+    return T
+
+
+class probs_cache:
+    """A content-addressed cache of transition probability matrices.
+    Matrices are kept in an in-memory LRU cache and, optionally, in a
+    directory that can be shared by several processes. Entries are
+    written to a temporary directory and renamed into place, so readers
+    never see partial entries. Hits from disk are memory-mapped.
+    Cached matrices are read-only.
+
+    Parameters
+    ----------
+    max_bytes : int, default=2**30
+        The maximum total size of the matrices held in memory.
+    cache_dir : str, default=None
+        Optionally store entries in this directory as well.
+    """
+
+    def __init__(self, max_bytes=2**30, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._entries = collections.OrderedDict()
+        self._n_bytes = 0
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __contains__(self, key):
+        return (key in self._entries) or \
+            ((self.cache_dir is not None) and
+                os.path.isdir(os.path.join(self.cache_dir, key)))
+
+    def _remember(self, key, T):
+        n_bytes = _nbytes(T)
+        if n_bytes > self.max_bytes:
+            return
+        self._entries[key] = T
+        self._n_bytes += n_bytes
+        # evict the least recently used entries
+        while self._n_bytes > self.max_bytes:
+            _, old_T = self._entries.popitem(last=False)
+            self._n_bytes -= _nbytes(old_T)
+
+    def _read(self, key):
+        entry_dir = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(entry_dir):
+            return None
+        if os.path.exists(os.path.join(entry_dir, 'T.npy')):
+            return np.load(os.path.join(entry_dir, 'T.npy'), mmap_mode='r')
+        arrays = [
+            np.load(os.path.join(entry_dir, name + '.npy'), mmap_mode='r')
+            for name in ['data', 'indices', 'indptr', 'shape']]
+        return spar.csr_matrix(
+            tuple(arrays[:3]), shape=tuple(arrays[3]), copy=False)
+
+    def _write(self, key, T):
+        entry_dir = os.path.join(self.cache_dir, key)
+        if os.path.isdir(entry_dir):
+            return
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=self.cache_dir)
+        try:
+            if spar.issparse(T):
+                T = spar.csr_matrix(T)
+                arrays = {
+                    'data': T.data, 'indices': T.indices,
+                    'indptr': T.indptr, 'shape': np.array(T.shape)}
+            else:
+                arrays = {'T': T}
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_dir, name + '.npy'), array)
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # another process stored the same entry first
+            if not os.path.isdir(entry_dir):
+                raise
+        finally:
+            if os.path.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir)
+
+    def get(self, key):
+        """Returns the cached matrix for `key`, or None on a miss."""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        if self.cache_dir is None:
+            return None
+        T = self._read(key)
+        if T is not None:
+            self._remember(key, T)
+        return T
+
+    def put(self, key, T):
+        """Stores a matrix under `key` and returns the cached copy."""
+        if self.cache_dir is not None:
+            self._write(key, T)
+            T = self._read(key)
+        else:
+            T = _read_only(T)
+        self._remember(key, T)
+        return T
+
+    def get_or_compute(self, key, compute):
+        """Returns the cached matrix for `key`, calling `compute()` and
+        storing its output on a miss."""
+        T = self.get(key)
+        if T is None:
+            T = self.put(key, compute())
+        return T
+
+    def clear(self, disk=False):
+        """Empties the in-memory cache, and optionally the directory."""
+        self._entries.clear()
+        self._n_bytes = 0
+        if disk and (self.cache_dir is not None):
+            shutil.rmtree(self.cache_dir)
+            os.makedirs(self.cache_dir)
@@ -0,0 +1,119 @@
+import numpy as np
+from . import landscape
+
+
+class lattice_coarse_graining:
+    """Coarse-grains a landscape by lumping blocks of `factor` x `factor`
+    lattice states into single states. The coarse landscape shares the
+    fine surface, with `factor` times as many surface points between
+    states, so the coarse transition probabilities come from the highest
+    barriers of the fine surface between block centers. Coarse states
+    can be mapped back to fine states, i.e. to screen with
+    adaptive_sampling on the coarse level and refine the selected
+    states.
+
+    Parameters
+    ----------
+    l : landscape object
+        The fine landscape.
+    factor : int
+        The number of fine states along each side of a coarse state.
+        Must divide both dimensions of the fine grid.
+
+    Attributes
+    ----------
+    landscape : landscape object
+        The coarse landscape.
+    grid_size : tuple
+        The dimensions of the coarse grid.
+    fine_to_coarse : array, shape=(n_fine_states, )
+        The coarse state of each fine state.
+    coarse_to_fine : array, shape=(n_coarse_states, factor**2)
+        The fine states within each coarse state.
+    """
+
+    def __init__(self, l, factor):
+        factor = int(factor)
+        fine_grid_size = tuple(int(g) for g in l.grid_size)
+        if (fine_grid_size[0] % factor) or (fine_grid_size[1] % factor):
+            raise ValueError(
+                "factor %d does not divide the grid size %s." %
+                (factor, fine_grid_size))
+        self.fine_landscape = l
+        self.factor = factor
+        self.fine_grid_size = fine_grid_size
+        self.grid_size = (
+            fine_grid_size[0] // factor, fine_grid_size[1] // factor)
+        # states are numbered along x1 first
+        n_fine_states = fine_grid_size[0] * fine_grid_size[1]
+        rows, cols = np.divmod(np.arange(n_fine_states), fine_grid_size[0])
+        self.fine_to_coarse = (rows // factor) * self.grid_size[0] + \
+            (cols // factor)
+        self.coarse_to_fine = np.argsort(
+            self.fine_to_coarse, kind='stable').reshape(
+                (-1, factor * factor))
+        self.landscape = landscape(
+            x1_coords=l.x1_coords, x2_coords=l.x2_coords, values=l.values)
+        self.landscape.grid_size = self.grid_size
+
+    @property
+    def n_states(self):
+        return len(self.coarse_to_fine)
+
+    def to_probs(self, **kwargs):
+        """The coarse transition probability matrix. Keyword arguments
+        are passed on to landscape.to_probs."""
+        return self.landscape.to_probs(**kwargs)
+
+    def fine_energies(self):
+        """The energy of each fine state, taken at the state centers."""
+        values = self.fine_landscape.values
+        res = values.shape[1] // self.fine_grid_size[0]
+        return np.asarray(values[res//2::res, res//2::res]).flatten()
+
+    def coarsen(self, assignments):
+        """Maps fine assignments to coarse assignments. Negative frames
+        are kept as missing data."""
+        assignments = np.asarray(assignments)
+        coarse = self.fine_to_coarse[np.maximum(assignments, 0)]
+        coarse[assignments < 0] = -1
+        return coarse.astype(assignments.dtype)
+
+    def refine(self, coarse_states, method='min_energy', rng=None):
+        """Picks a fine state within each coarse state.
+
+        Parameters
+        ----------
+        coarse_states : array-like, shape=(n_states, )
+            The coarse states to refine.
+        method : str, default='min_energy'
+            'min_energy' picks the lowest energy fine state of each
+            block, 'center' the fine state at the middle of each block,
+            and 'random' a uniformly random fine state of each block.
+        rng : numpy.random.Generator, default=None
+            The random number generator used by 'random'.
+
+        Returns
+        ----------
+        fine_states : array, shape=(n_states, )
+            The fine states.
+        """
+        coarse_states = np.asarray(coarse_states)
+        blocks = self.coarse_to_fine[coarse_states]
+        if method == 'min_energy':
+            block_energies = self.fine_energies()[blocks]
+            picks = np.argmin(block_energies, axis=-1)
+        elif method == 'center':
+            center = self.factor // 2
+            picks = np.zeros(coarse_states.shape, dtype=int) + \
+                (center * self.factor + center)
+        elif method == 'random':
+            if rng is None:
+                rng = np.random.default_rng()
+            picks = rng.integers(
+                self.factor * self.factor, size=coarse_states.shape)
+        else:
+            raise ValueError(
+                "method must be 'min_energy', 'center', or 'random'. "
+                "Got '%s'." % method)
+        return np.take_along_axis(blocks, picks[..., None], axis=-1)[..., 0]
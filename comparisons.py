@@ -0,0 +1,201 @@
+import copy
+import numpy as np
+from scipy import stats
+from . import executors, stop_conditions
+from .mc_sampling import (
+    Adaptive_Sampling, _n_states, _rep_seeds, _shared_sampler, synth_trajs)
+from enspara.msm import builders, MSM
+from functools import partial
+
+
+def _compare_rep(compare_info):
+    """Helper to compare_rankings. Simulates the initial round of a rep
+    once and continues it with every ranking object, drawing from the
+    same random stream each time."""
+    (sampler, initial_state, n_runs, n_clones, n_steps, msm_obj,
+        ranking_objs, skip_self, incremental, stop_condition, rep_num,
+        seed_seq) = compare_info
+    initial_seed, policy_seed = seed_seq.spawn(2)
+    initial_assignments = synth_trajs(
+        sampler, n_steps + 1, np.repeat(initial_state, n_clones),
+        rng=np.random.default_rng(initial_seed), skip_self=skip_self)
+    rep_assignments = []
+    rep_discoveries = []
+    for ranking_obj in ranking_objs:
+        adaptive_sampling_obj = Adaptive_Sampling(
+            sampler, initial_state, n_runs - 1, n_clones, n_steps,
+            copy.deepcopy(msm_obj), copy.deepcopy(ranking_obj),
+            assignments=initial_assignments, skip_self=skip_self,
+            incremental=incremental, stop_condition=stop_condition)
+        rep_assignments.append(
+            adaptive_sampling_obj.run(
+                rng=np.random.default_rng(policy_seed)))
+        rep_discoveries.append(adaptive_sampling_obj.discovery_)
+    return rep_num, np.array(rep_assignments), np.array(rep_discoveries)
+
+
+def compare_rankings(
+        T, ranking_objs, initial_state=0, n_runs=1, n_clones=1, n_steps=1,
+        msm_obj=None, n_reps=1, n_procs=1, end_state=None, seed=None,
+        skip_self=False, incremental=False, executor=None,
+        return_assignments=False):
+    """Compares ranking objects with common random numbers. For every
+    rep, the initial round from `initial_state` is simulated once and
+    shared by all ranking objects, and the later rounds of every ranking
+    object draw from the same random stream. The outcomes of different
+    ranking objects on the same rep are then positively correlated, so
+    their paired differences need fewer reps to resolve than
+    independent runs.
+
+    Parameters
+    ----------
+    T : array, sparse matrix, or TransitionSampler
+        The transition probability matrix from which to sample.
+    ranking_objs : list or dict of rankings objects
+        The ranking objects to compare. With a dict, the keys are used
+        as names.
+    initial_state : int, default=0
+        The initial state from which to start simulations.
+    n_runs : int, default=1
+        The number of rounds of adaptive sampling, including the shared
+        initial round.
+    n_clones : int, default=1
+        The number of clones per run of adaptive sampling.
+    n_steps : int, default=1
+        The number of steps per clone (each trajectory).
+    msm_obj : enspara.msm.MSM object, default=None
+        An enspara MSM object used to fit assignments at each round.
+    n_reps : int, default=1
+        The number of repetitions per ranking object.
+    n_procs : int, default=1
+        The number of processes to use. This parallelizes over reps.
+    end_state : int or array-like, default=None
+        Optionally compare the round in which `end_state` is discovered.
+        Reps stop once it is discovered. Otherwise, the number of states
+        discovered by the end of the run is compared.
+    seed : int or numpy.random.SeedSequence, default=None
+        The master seed.
+    skip_self : bool, default=False
+        Optionally skip over self-transitions by drawing the length of
+        each dwell from a geometric distribution.
+    incremental : bool, default=False
+        Optionally count only the transitions of each new round.
+    executor : str or executor object, default=None
+        How reps are run (see executors.get_executor).
+    return_assignments : bool, default=False
+        Optionally keep the assignments of every ranking object and rep.
+
+    Returns
+    ----------
+    comparison : ranking_comparison object
+        The outcome of every ranking object on every rep.
+    """
+    if isinstance(ranking_objs, dict):
+        names = list(ranking_objs.keys())
+        ranking_objs = list(ranking_objs.values())
+    else:
+        names = [
+            ranking_obj.__class__.__name__ for ranking_obj in ranking_objs]
+    if n_runs < 1:
+        raise ValueError("n_runs must be at least 1.")
+    if msm_obj is None:
+        builder_obj = partial(builders.normalize, calculate_eq_probs=False)
+        msm_obj = MSM(
+            lag_time=1, method=builder_obj, max_n_states=_n_states(T))
+    msm_obj.max_n_states = _n_states(T)
+    stop_condition = None
+    if end_state is not None:
+        stop_condition = stop_conditions.target_states(end_state)
+    n_rankings = len(ranking_objs)
+    assignments = None
+    discoveries = np.zeros((n_rankings, n_reps, 3), dtype=int)
+    metrics = np.zeros((n_rankings, n_reps))
+    with _shared_sampler(T, skip_self=skip_self) as sampler:
+        compare_info = [
+            (sampler, initial_state, n_runs, n_clones, n_steps, msm_obj,
+                ranking_objs, skip_self, incremental, stop_condition,
+                rep_num, seed_seq)
+            for rep_num, seed_seq in enumerate(_rep_seeds(seed, n_reps))]
+        with executors.get_executor(executor, n_procs=n_procs) as pool:
+            for rep_num, rep_assignments, rep_discoveries in \
+                    pool.imap_unordered(_compare_rep, compare_info):
+                discoveries[:, rep_num] = rep_discoveries
+                if end_state is not None:
+                    # reps that never discover end_state count as n_runs
+                    rounds = rep_discoveries[:, 0]
+                    metrics[:, rep_num] = np.where(
+                        rounds >= 0, rounds, n_runs)
+                else:
+                    metrics[:, rep_num] = [
+                        len(np.unique(ass[ass >= 0]))
+                        for ass in rep_assignments]
+                if return_assignments:
+                    if assignments is None:
+                        assignments = np.zeros(
+                            (n_rankings, n_reps) + rep_assignments.shape[1:],
+                            dtype=rep_assignments.dtype)
+                    assignments[:, rep_num] = rep_assignments
+    metric = 'discovery_round' if end_state is not None else 'n_discovered'
+    return ranking_comparison(
+        names, metric, metrics, discoveries, assignments=assignments)
+
+
+class ranking_comparison:
+    """The outcomes of compare_rankings.
+
+    Attributes
+    ----------
+    names : list
+        The name of each ranking object.
+    metric : str
+        'discovery_round' (the round in which end_state was discovered,
+        or n_runs if it was not) or 'n_discovered' (the number of states
+        discovered).
+    metrics : array, shape=(n_rankings, n_reps)
+        The metric of each ranking object on each rep.
+    discoveries : array, shape=(n_rankings, n_reps, 3)
+        The (round, clone, frame) at which each rep discovered end_state,
+        or -1.
+    assignments : array, shape=(n_rankings, n_reps, n_runs, n_clones, n_steps)
+        The assignments, if they were kept.
+    """
+
+    def __init__(self, names, metric, metrics, discoveries, assignments=None):
+        self.names = names
+        self.metric = metric
+        self.metrics = metrics
+        self.discoveries = discoveries
+        self.assignments = assignments
+
+    def paired_differences(self, reference=0, confidence=0.95):
+        """The mean difference in the metric between each ranking object
+        and a reference, taken rep by rep.
+
+        Parameters
+        ----------
+        reference : int or str, default=0
+            The index or name of the reference ranking object.
+        confidence : float, default=0.95
+            The confidence level of the intervals.
+
+        Returns
+        ----------
+        differences : array, shape=(n_rankings, )
+            The mean paired difference of each ranking object minus the
+            reference.
+        intervals : array, shape=(n_rankings, 2)
+            The normal-approximation confidence interval of each mean
+            difference.
+        """
+        if isinstance(reference, str):
+            reference = self.names.index(reference)
+        diffs = self.metrics - self.metrics[reference]
+        n_reps = diffs.shape[1]
+        differences = diffs.mean(axis=1)
+        if n_reps < 2:
+            return differences, np.zeros((len(diffs), 2)) + np.nan
+        z = stats.norm.ppf(0.5 + confidence/2.)
+        half_widths = z * diffs.std(axis=1, ddof=1) / np.sqrt(n_reps)
+        intervals = np.array(
+            [differences - half_widths, differences + half_widths]).T
+        return differences, intervals
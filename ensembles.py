@@ -0,0 +1,214 @@
+import json
+import numpy as np
+import os
+import scipy.sparse as spar
+from multiprocessing import Pool
+from . import landscape
+
+
+class noise_recipe:
+    """A recipe for noisy realizations of a base landscape. Calling the
+    recipe with a numpy.random.Generator returns one realization.
+
+    Parameters
+    ----------
+    base : landscape or lazy_landscape object
+        The landscape to add noise to, i.e. the output of one of the
+        builders in special_landscapes.
+    **noise_kwargs
+        Keyword arguments passed on to `add_noise`.
+    """
+
+    def __init__(self, base, **noise_kwargs):
+        self.base = base
+        self.noise_kwargs = noise_kwargs
+
+    def __call__(self, rng):
+        return self.base.add_noise(rng=rng, **self.noise_kwargs)
+
+
+def _generate_member(member_info):
+    """Helper to generate_ensemble. Builds a single realization and its
+    sparse transition probability matrix."""
+    member_num, recipe, seed_seq, to_probs = member_info
+    l = recipe(np.random.default_rng(seed_seq))
+    T = None
+    if to_probs:
+        T = l.to_probs(sparse=True)
+    return member_num, l.grid_size, l.values, T
+
+
+def _open_array(output_dir, name, shape, dtype):
+    if output_dir is None:
+        return np.zeros(shape, dtype=dtype)
+    return np.lib.format.open_memmap(
+        os.path.join(output_dir, name + '.npy'), mode='w+', dtype=dtype,
+        shape=shape)
+
+
+def generate_ensemble(
+        recipe, n_realizations, seed=None, n_procs=1, output_dir=None,
+        to_probs=True):
+    """Generates many realizations of a landscape recipe in parallel.
+    Each realization gets an independent random stream from
+    `SeedSequence.spawn`, so the ensemble only depends on `seed`.
+
+    Parameters
+    ----------
+    recipe : callable
+        A picklable callable that takes a numpy.random.Generator and
+        returns a landscape, i.e. a noise_recipe.
+    n_realizations : int
+        The number of realizations to generate.
+    seed : int or numpy.random.SeedSequence, default=None
+        The master seed of the ensemble.
+    n_procs : int, default=1
+        The number of processes to use.
+    output_dir : str, default=None
+        Optionally write the ensemble to this directory as it is
+        generated, instead of holding it in memory.
+    to_probs : bool, default=True
+        Whether to also build the transition probability matrices.
+
+    Returns
+    ----------
+    ensemble : landscape_ensemble object
+        The stacked realizations.
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    seed_seqs = seed.spawn(n_realizations)
+    member_info = [
+        (num, recipe, seed_seqs[num], to_probs)
+        for num in range(n_realizations)]
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    values = None
+    T_data = None
+    T_indices = None
+    T_indptr = None
+    pool = Pool(processes=n_procs)
+    try:
+        for num, grid_size, member_values, T in pool.imap_unordered(
+                _generate_member, member_info):
+            # allocate storage once the shapes are known
+            if values is None:
+                values = _open_array(
+                    output_dir, 'values',
+                    (n_realizations,) + member_values.shape,
+                    member_values.dtype)
+                if T is not None:
+                    T_indices = T.indices
+                    T_indptr = T.indptr
+                    T_data = _open_array(
+                        output_dir, 'T_data', (n_realizations, T.nnz),
+                        T.dtype)
+            values[num] = member_values
+            if T is not None:
+                if not (
+                        np.array_equal(T.indices, T_indices) and
+                        np.array_equal(T.indptr, T_indptr)):
+                    raise ValueError(
+                        "Realizations do not share a sparsity pattern.")
+                T_data[num] = T.data
+    finally:
+        pool.terminate()
+    resolution = values.shape[2] // grid_size[0]
+    ensemble = landscape_ensemble(
+        grid_size, resolution, values, T_data=T_data, T_indices=T_indices,
+        T_indptr=T_indptr)
+    if output_dir is not None:
+        ensemble.save(output_dir)
+    return ensemble
+
+
+class landscape_ensemble:
+    """Stacked realizations of a landscape and their transition
+    probability matrices. All matrices share one sparsity pattern, so
+    only their nonzero values are stored per realization.
+
+    Parameters
+    ----------
+    grid_size : tuple
+        The dimensions of each landscape.
+    resolution : int
+        The number of energies between states on the grid.
+    values : array, shape=(n_realizations, n_rows, n_cols)
+        The energies of each realization.
+    T_data : array, shape=(n_realizations, nnz), default=None
+        The nonzero transition probabilities of each realization.
+    T_indices : array, shape=(nnz, ), default=None
+        The CSR column indices shared by all transition matrices.
+    T_indptr : array, shape=(n_states+1, ), default=None
+        The CSR row pointers shared by all transition matrices.
+    """
+
+    def __init__(
+            self, grid_size, resolution, values, T_data=None, T_indices=None,
+            T_indptr=None):
+        self.grid_size = tuple(int(g) for g in grid_size)
+        self.resolution = int(resolution)
+        self.values = values
+        self.T_data = T_data
+        self.T_indices = T_indices
+        self.T_indptr = T_indptr
+
+    def __len__(self):
+        return len(self.values)
+
+    def landscape(self, num):
+        """Returns realization `num` as a landscape object."""
+        l = landscape(grid_size=self.grid_size, resolution=self.resolution)
+        l.values = self.values[num]
+        return l
+
+    def to_probs(self, num):
+        """Returns the transition probability matrix of realization `num`
+        as a CSR matrix."""
+        if self.T_data is None:
+            return self.landscape(num).to_probs(sparse=True)
+        n_states = len(self.T_indptr) - 1
+        return spar.csr_matrix(
+            (self.T_data[num], self.T_indices, self.T_indptr),
+            shape=(n_states, n_states))
+
+    def save(self, output_dir):
+        """Writes the ensemble to a directory of .npy files that can be
+        memory-mapped by `landscape_ensemble.load`."""
+        os.makedirs(output_dir, exist_ok=True)
+        arrays = {
+            'values': self.values, 'T_data': self.T_data,
+            'T_indices': self.T_indices, 'T_indptr': self.T_indptr}
+        for name, array in arrays.items():
+            if array is None:
+                continue
+            filename = os.path.join(output_dir, name + '.npy')
+            # arrays written while generating are already in place
+            if isinstance(array, np.memmap) and \
+                    os.path.abspath(array.filename) == \
+                    os.path.abspath(filename):
+                array.flush()
+            else:
+                np.save(filename, array)
+        info = {
+            'grid_size': self.grid_size, 'resolution': self.resolution,
+            'n_realizations': len(self)}
+        with open(os.path.join(output_dir, 'info.json'), 'w') as f:
+            json.dump(info, f)
+
+    def load(input_dir, mmap_mode='r'):
+        """Loads an ensemble written by `save`. Arrays are memory-mapped
+        by default, so realizations are only read when indexed."""
+        with open(os.path.join(input_dir, 'info.json')) as f:
+            info = json.load(f)
+        arrays = {}
+        for name in ['values', 'T_data', 'T_indices', 'T_indptr']:
+            filename = os.path.join(input_dir, name + '.npy')
+            if os.path.exists(filename):
+                arrays[name] = np.load(filename, mmap_mode=mmap_mode)
+            else:
+                arrays[name] = None
+        return landscape_ensemble(
+            info['grid_size'], info['resolution'], arrays['values'],
+            T_data=arrays['T_data'], T_indices=arrays['T_indices'],
+            T_indptr=arrays['T_indptr'])
@@ -1,36 +1,47 @@
 import numpy as np
 import itertools
+import scipy.sparse as spar
+from . import precision
 
 
-def _calc_row_of_sampling(T, row, steps):
-    V = np.zeros(T.shape)
-    V[range(len(T)),range(len(T))] = 1
+def _calc_row_of_sampling(T, row, steps, dtype=np.float64):
+    n_states = T.shape[0]
+    V = np.zeros(T.shape, dtype=dtype)
+    V[range(n_states),range(n_states)] = 1
     not_probs = 1
     for step in range(steps):
-        V = np.matmul(V, T)
+        if spar.issparse(T):
+            # (T^T V^T)^T keeps the product dense without densifying T
+            V = np.asarray(T.T.dot(V.T).T, dtype=dtype)
+        else:
+            V = np.matmul(V, T).astype(dtype, copy=False)
         not_probs *= (1-V)
         V[:,row] = 0
-        V /= V.sum(axis=1)[:,None]
+        V /= V.sum(axis=1, dtype=np.float64)[:,None]
     row_prob = (1-not_probs)[:,row]
     return row_prob
 
 
-def _calc_discover_probs_stepping(T, steps=1, self_known=True):
-    n_states = len(T)
+def _calc_discover_probs_stepping(
+        T, steps=1, self_known=True, dtype=np.float64):
+    n_states = T.shape[0]
     discover_probs = []
     for state in range(n_states):
         discover_probs.append(
-            _calc_row_of_sampling(T, state, steps))
+            _calc_row_of_sampling(T, state, steps, dtype=dtype))
     discover_probs = np.array(discover_probs).T
     if self_known is True:
         discover_probs[range(n_states), range(n_states)] = 1
     return discover_probs
 
 
-def calc_discover_probs(T, steps=1, clones=1, self_known=True):
+def calc_discover_probs(T, steps=1, clones=1, self_known=True, dtype=None):
     """The probability of discovering state j after S steps from state i
-       with M trajectories."""
+       with M trajectories. T can be a dense array or a scipy.sparse
+       matrix. `dtype` is the float type of the intermediate matrices and
+       defaults to the float type of the precision policy."""
     discover_probs = _calc_discover_probs_stepping(
-        T, steps=steps, self_known=self_known)
+        T, steps=steps, self_known=self_known,
+        dtype=precision.get_float_dtype(dtype))
     discover_probs = np.array(1-((1-discover_probs)**clones))
     return discover_probs
@@ -0,0 +1,145 @@
+import abc
+import concurrent.futures
+from multiprocessing import Pool
+
+
+class serial_executor:
+    """Runs tasks one after the other in the calling process."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def imap_unordered(self, func, iterable):
+        for item in iterable:
+            yield func(item)
+
+
+class process_executor:
+    """Runs tasks on a multiprocessing pool. Tasks are handed out one at
+    a time, so workers that finish early pick up the remaining tasks.
+
+    Parameters
+    ----------
+    n_procs : int, default=1
+        The number of processes to use.
+    """
+
+    def __init__(self, n_procs=1):
+        self.n_procs = n_procs
+        self._pool = None
+
+    def __enter__(self):
+        self._pool = Pool(processes=self.n_procs)
+        return self
+
+    def __exit__(self, *args):
+        self._pool.terminate()
+        self._pool = None
+
+    def imap_unordered(self, func, iterable):
+        return self._pool.imap_unordered(func, iterable, chunksize=1)
+
+
+class _futures_executor(metaclass=abc.ABCMeta):
+    """Base class for executors from concurrent.futures. Every task is
+    submitted up front and results are yielded as they complete, so the
+    pool balances uneven tasks dynamically."""
+
+    @abc.abstractmethod
+    def _make_executor(self):
+        """Returns the concurrent.futures.Executor to submit tasks to."""
+
+    def __enter__(self):
+        self._executor = self._make_executor()
+        return self
+
+    def __exit__(self, *args):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+
+    def imap_unordered(self, func, iterable):
+        futures = [self._executor.submit(func, item) for item in iterable]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+
+class thread_executor(_futures_executor):
+    """Runs tasks on a thread pool. Useful when most of the time is
+    spent in numpy or scipy calls that release the GIL.
+
+    Parameters
+    ----------
+    n_threads : int, default=1
+        The number of threads to use.
+    """
+
+    def __init__(self, n_threads=1):
+        self.n_threads = n_threads
+
+    def _make_executor(self):
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.n_threads)
+
+
+class mpi_executor(_futures_executor):
+    """Runs tasks on MPI processes with mpi4py.futures, i.e. across the
+    nodes of an allocation. Launch the script with
+    `mpirun -n 4 python -m mpi4py.futures script.py`, or let
+    MPIPoolExecutor spawn workers.
+
+    Parameters
+    ----------
+    max_workers : int, default=None
+        The number of MPI workers. Defaults to the size of the MPI
+        universe.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+
+    def _make_executor(self):
+        try:
+            from mpi4py.futures import MPIPoolExecutor
+        except ImportError:
+            raise ImportError("mpi_executor requires mpi4py.")
+        return MPIPoolExecutor(max_workers=self.max_workers)
+
+
+EXECUTORS = {
+    'serial': serial_executor,
+    'process': process_executor,
+    'thread': thread_executor,
+    'mpi': mpi_executor,
+}
+
+
+def get_executor(executor=None, n_procs=1):
+    """Returns an executor object.
+
+    Parameters
+    ----------
+    executor : str or executor object, default=None
+        One of 'serial', 'process', 'thread' or 'mpi', or an object
+        with the same interface (a context manager with an
+        imap_unordered(func, iterable) method). Defaults to 'process'.
+    n_procs : int, default=1
+        The number of workers of a 'process' or 'thread' executor.
+
+    Returns
+    ----------
+    executor : executor object
+    """
+    if executor is None:
+        executor = 'process'
+    if not isinstance(executor, str):
+        return executor
+    if executor not in EXECUTORS:
+        raise ValueError(
+            "executor must be one of %s. Got '%s'." % (
+                ', '.join(EXECUTORS), executor))
+    if executor in ['process', 'thread']:
+        return EXECUTORS[executor](n_procs)
+    return EXECUTORS[executor]()
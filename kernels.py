@@ -0,0 +1,245 @@
+import numpy as np
+import scipy.sparse as spar
+
+# numba is optional. Without it, the numpy implementations are used.
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+BACKENDS = ['numpy', 'numba']
+_backend = 'numpy' if numba is None else 'numba'
+
+
+def set_backend(backend='auto'):
+    """Selects the implementation used for the inner loops of trajectory
+    generation and count accumulation.
+
+    Parameters
+    ----------
+    backend : str, default='auto'
+        One of 'numpy', 'numba', or 'auto'. 'auto' picks numba if it can
+        be imported and numpy otherwise.
+    """
+    global _backend
+    if backend == 'auto':
+        backend = 'numpy' if numba is None else 'numba'
+    if backend not in BACKENDS:
+        raise ValueError(
+            "backend must be one of %s or 'auto'. Got '%s'." %
+            (BACKENDS, backend))
+    if (backend == 'numba') and (numba is None):
+        raise ImportError("The numba backend requires numba to be installed.")
+    _backend = backend
+
+
+def get_backend():
+    """Returns the name of the active backend."""
+    return _backend
+
+
+def _resolve_backend(backend):
+    if backend is None:
+        return _backend
+    if (backend == 'numba') and (numba is None):
+        raise ImportError("The numba backend requires numba to be installed.")
+    return backend
+
+
+########################################################################
+#                        numpy implementations                         #
+########################################################################
+
+
+def _trajs_numpy(cols, cdf, start_states, us, trajs):
+    n_steps = len(us) + 1
+    trajs[:, 0] = start_states
+    states = trajs[:, 0]
+    for i in range(n_steps - 1):
+        # counting the cdf values <= u is the vectorized equivalent
+        # of searchsorted with side='right'
+        ks = np.sum(cdf[states] <= us[i][:, None], axis=1)
+        states = cols[states, ks]
+        trajs[:, i+1] = states
+    return trajs
+
+
+def _unique_pairs_numpy(froms, tos, n_states):
+    codes = froms * n_states + tos
+    codes, counts = np.unique(codes, return_counts=True)
+    return codes // n_states, codes % n_states, counts
+
+
+def _observed_numpy(rows, states, n_rows, n_states):
+    observed = np.zeros((n_rows, n_states), dtype=bool)
+    observed[rows, states] = True
+    return observed
+
+
+########################################################################
+#                        numba implementations                         #
+########################################################################
+
+
+def _trajs_loop(cols, cdf, start_states, us, trajs):
+    n_walkers = start_states.shape[0]
+    n_steps = us.shape[0] + 1
+    for w in range(n_walkers):
+        state = start_states[w]
+        trajs[w, 0] = state
+        for i in range(n_steps - 1):
+            u = us[i, w]
+            k = 0
+            while cdf[state, k] <= u:
+                k += 1
+            state = cols[state, k]
+            trajs[w, i+1] = state
+    return trajs
+
+
+def _unique_pairs_loop(froms, tos, n_states):
+    codes = np.sort(froms * n_states + tos)
+    n_unique = 0
+    for i in range(codes.shape[0]):
+        if (i == 0) or (codes[i] != codes[i-1]):
+            n_unique += 1
+    unique_codes = np.zeros(n_unique, dtype=np.int64)
+    counts = np.zeros(n_unique, dtype=np.int64)
+    j = -1
+    for i in range(codes.shape[0]):
+        if (i == 0) or (codes[i] != codes[i-1]):
+            j += 1
+            unique_codes[j] = codes[i]
+        counts[j] += 1
+    return unique_codes // n_states, unique_codes % n_states, counts
+
+
+def _observed_loop(rows, states, n_rows, n_states):
+    observed = np.zeros((n_rows, n_states), dtype=np.bool_)
+    for i in range(rows.shape[0]):
+        observed[rows[i], states[i]] = True
+    return observed
+
+
+if numba is not None:
+    _trajs_numba = numba.njit(_trajs_loop)
+    _unique_pairs_numba = numba.njit(_unique_pairs_loop)
+    _observed_numba = numba.njit(_observed_loop)
+
+
+########################################################################
+#                               kernels                                #
+########################################################################
+
+
+def _ravel_rows(assignments):
+    """Returns the row index and state of every valid (non-negative)
+    frame of a 2D array or a list of trajectories."""
+    if isinstance(assignments, np.ndarray) and (assignments.dtype != object):
+        assignments = assignments.reshape((len(assignments), -1))
+        rows = np.repeat(np.arange(len(assignments)), assignments.shape[1])
+        states = assignments.flatten()
+        n_rows = len(assignments)
+    else:
+        lengths = [len(ass) for ass in assignments]
+        rows = np.repeat(np.arange(len(lengths)), lengths)
+        states = np.concatenate(
+            [np.asarray(ass).flatten() for ass in assignments])
+        n_rows = len(lengths)
+    valid = states >= 0
+    return (
+        np.array(rows[valid], dtype=np.int64),
+        np.array(states[valid], dtype=np.int64), n_rows)
+
+
+def trajs_from_tables(
+        cols, cdf, start_states, us, backend=None, dtype=None, out=None):
+    """Advances walkers through padded sampling tables (see
+    mc_sampling.TransitionSampler). `us` holds one row of uniform random
+    numbers per step, so both backends give identical trajectories for
+    the same draws.
+
+    Parameters
+    ----------
+    cols : array, shape=(n_states, max_k)
+        The destination states of each row.
+    cdf : array, shape=(n_states, max_k)
+        The cumulative transition probabilities of each row.
+    start_states : array, shape=(n_walkers, )
+        The starting state of each walker.
+    us : array, shape=(n_steps-1, n_walkers)
+        Uniform random numbers in [0, 1).
+    backend : str, default=None
+        Overrides the active backend.
+    dtype : dtype, default=None
+        The integer type of the trajectories. Defaults to the type of
+        `cols`.
+    out : array, shape=(n_walkers, n_steps), default=None
+        Optionally write the trajectories into this array.
+
+    Returns
+    ----------
+    trajs : array, shape=(n_walkers, n_steps)
+        The trajectory of each walker.
+    """
+    start_states = np.array(start_states, dtype=np.int64).reshape((-1,))
+    if out is not None:
+        trajs = out
+    else:
+        if dtype is None:
+            dtype = cols.dtype
+        trajs = np.zeros((len(start_states), len(us) + 1), dtype=dtype)
+    if _resolve_backend(backend) == 'numba':
+        return _trajs_numba(cols, cdf, start_states, us, trajs)
+    return _trajs_numpy(cols, cdf, start_states, us, trajs)
+
+
+def transition_counts(assignments, n_states, lag_time=1, backend=None):
+    """Counts the transitions observed in a set of trajectories with a
+    sliding window. Negative frames are treated as missing data.
+
+    Parameters
+    ----------
+    assignments : array-like, shape=(n_trajs, n_frames)
+        A 2D array or a list of trajectories.
+    n_states : int
+        The total number of states.
+    lag_time : int, default=1
+        The lag time for counting transitions.
+    backend : str, default=None
+        Overrides the active backend.
+
+    Returns
+    ----------
+    C : sparse matrix, shape=(n_states, n_states)
+        The transition count matrix.
+    """
+    if isinstance(assignments, np.ndarray) and (assignments.dtype != object):
+        assignments = assignments.reshape((-1, assignments.shape[-1]))
+        froms = assignments[:, :-lag_time].flatten()
+        tos = assignments[:, lag_time:].flatten()
+    else:
+        froms = np.concatenate(
+            [np.asarray(ass)[:-lag_time] for ass in assignments])
+        tos = np.concatenate(
+            [np.asarray(ass)[lag_time:] for ass in assignments])
+    valid = (froms >= 0) * (tos >= 0)
+    froms = np.array(froms[valid], dtype=np.int64)
+    tos = np.array(tos[valid], dtype=np.int64)
+    if _resolve_backend(backend) == 'numba':
+        rows, cols, counts = _unique_pairs_numba(froms, tos, n_states)
+    else:
+        rows, cols, counts = _unique_pairs_numpy(froms, tos, n_states)
+    C = spar.coo_matrix((counts, (rows, cols)), shape=(n_states, n_states))
+    return C.tocsr()
+
+
+def observed_states(assignments, n_states, backend=None):
+    """Returns a boolean array marking the states visited by each row of
+    `assignments` (a 2D array or a list of trajectories). Negative frames
+    are ignored."""
+    rows, states, n_rows = _ravel_rows(assignments)
+    if _resolve_backend(backend) == 'numba':
+        return _observed_numba(rows, states, n_rows, n_states)
+    return _observed_numpy(rows, states, n_rows, n_states)
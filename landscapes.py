@@ -1,13 +1,15 @@
 import collections
 import glob
 import itertools
+import json
 import matplotlib.colors as colors
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import matplotlib.ticker as plticker
 import numpy as np
 import os
-from mdtraj import io
+import scipy.sparse as spar
+from . import caching, precision
 
 #######################################################################
 #                   formating and plotting stuff                      #
@@ -116,21 +118,107 @@ def _gaussian_multD(xs, x0s, height=1, widths=1, normed=False):
     return f
 
 
-def gaussian_noise(
-        x1s, x2s, gaussians_per_axis=None, height_range=[-0.1,0.1],
-        width_range=[0.9,1.1], rigidity=0):
-    """Given x1 coords and x2 coords, generates a specified number of evenly
-       spaced gaussians along each axis of varying height and widths. The
-       rigidity value determines how evenly spaced gaussians are (0 is loose
-       and 1 is rigid)."""
+def _gaussian_factors(axis, centers, widths, cutoff):
+    """One dimensional gaussian factors of each center along a grid
+    axis, evaluated only within `cutoff` widths of the center. Returns
+    the grid indices of each window and the factors, which are zero
+    where a window is shorter than the longest one."""
+    if cutoff is None:
+        lo_iis = np.zeros(len(centers), dtype=int)
+        hi_iis = np.zeros(len(centers), dtype=int) + len(axis)
+    else:
+        lo_iis = np.searchsorted(axis, centers - cutoff*widths, side='left')
+        hi_iis = np.searchsorted(axis, centers + cutoff*widths, side='right')
+    window = max(np.max(hi_iis - lo_iis), 0)
+    iis = lo_iis[:, None] + np.arange(window)
+    in_window = iis < hi_iis[:, None]
+    iis = np.minimum(iis, len(axis) - 1)
+    factors = np.exp(
+        -((axis[iis] - centers[:, None])**2) / (2 * (widths[:, None]**2)))
+    factors *= in_window
+    return iis, factors
+
+
+def _gaussian_sum(
+        axis1, axis2, centers, heights=1, widths=1, cutoff=None, out=None):
+    """Sums many 2D gaussians on the grid spanned by `axis1` (columns)
+    and `axis2` (rows). Gaussians are separable, so the sum is the
+    product of two sparse matrices of 1D factors, which are only
+    evaluated within `cutoff` widths of each center (over the full grid
+    if `cutoff` is None). The result is accumulated into `out` in place.
+
+    Parameters
+    ----------
+    axis1 : array, shape=(n_cols, )
+        The x1 values of the grid columns.
+    axis2 : array, shape=(n_rows, )
+        The x2 values of the grid rows.
+    centers : array, shape=(n_gaussians, 2)
+        The (x1, x2) center of each gaussian.
+    heights : float or array, shape=(n_gaussians, ), default=1
+        The height of each gaussian.
+    widths : float or array, shape=(n_gaussians, ) or (n_gaussians, 2)
+        The width of each gaussian, optionally per dimension.
+    cutoff : float, default=None
+        The number of widths from the center within which each gaussian
+        is evaluated.
+    out : array, shape=(n_rows, n_cols), default=None
+        The array to accumulate into. A new array of zeros if None.
+
+    Returns
+    ----------
+    out : array, shape=(n_rows, n_cols)
+        The sum of the gaussians.
+    """
+    axis1 = np.asarray(axis1)
+    axis2 = np.asarray(axis2)
+    centers = np.array(centers, dtype=float).reshape((-1, 2))
+    n_gaussians = len(centers)
+    heights = np.zeros(n_gaussians) + np.asarray(heights).reshape((-1,))
+    widths = np.asarray(widths, dtype=float)
+    if widths.ndim < 2:
+        widths = widths.reshape((-1, 1))
+    widths = np.zeros((n_gaussians, 2)) + widths
+    if out is None:
+        out = np.zeros(
+            (len(axis2), len(axis1)), dtype=precision.get_float_dtype())
+    if n_gaussians == 0:
+        return out
+    iis1, factors1 = _gaussian_factors(
+        axis1, centers[:, 0], widths[:, 0], cutoff)
+    iis2, factors2 = _gaussian_factors(
+        axis2, centers[:, 1], widths[:, 1], cutoff)
+    # sparse (n_gaussians, n_points) matrices of the factors. Heights
+    # are folded into the x2 factors.
+    gaussian_iis = np.arange(n_gaussians)
+    F1 = spar.csr_matrix(
+        (
+            factors1.flatten(),
+            (np.repeat(gaussian_iis, iis1.shape[1]), iis1.flatten())),
+        shape=(n_gaussians, len(axis1)))
+    F2 = spar.csr_matrix(
+        (
+            (factors2 * heights[:, None]).flatten(),
+            (np.repeat(gaussian_iis, iis2.shape[1]), iis2.flatten())),
+        shape=(n_gaussians, len(axis2)))
+    gaussians = spar.coo_matrix(F2.T.tocsr().dot(F1))
+    out[gaussians.row, gaussians.col] += gaussians.data
+    return out
+
+
+def _noise_gaussians(
+        axis1, axis2, gaussians_per_axis=None, height_range=[-0.1,0.1],
+        width_range=[0.9,1.1], rigidity=0, rng=None):
+    """Draws the centers, heights, and widths of the gaussians used for
+    noise, all in one shot. See `gaussian_noise`."""
+    if rng is None:
+        rng = np.random
     if type(gaussians_per_axis) is int:
         gaussians_per_axis = [gaussians_per_axis, gaussians_per_axis]
     elif gaussians_per_axis is None:
-        gaussians_per_axis = [int(x1s.max()/2.), int(x2s.max()/2.)]
+        gaussians_per_axis = [int(axis1.max()/2.), int(axis2.max()/2.)]
     tot_gaussians = np.prod(gaussians_per_axis)
     # dimension info
-    axis1 = x1s[0]
-    axis2 = x2s[:,0]
     box_length_1 = (axis1[-1]-axis1[0])/gaussians_per_axis[0]
     box_length_2 = (axis2[-1]-axis2[0])/gaussians_per_axis[1]
     box_centers_1 = (np.arange(gaussians_per_axis[0]) * box_length_1) + \
@@ -142,27 +230,37 @@ def gaussian_noise(
         list(itertools.product(box_centers_1, box_centers_2)))
     # heights
     height_spread = height_range[1] - height_range[0]
-    heights = [
-        height_spread * np.random.random() + height_range[0]
-        for n in range(tot_gaussians)]
+    heights = height_spread * rng.random(tot_gaussians) + height_range[0]
     # widths
     widths_spread = width_range[1] - width_range[0]
-    widths = [
-        widths_spread * np.random.random() + width_range[0]
-        for n in range(tot_gaussians)]
-    # rigid formula and initialize noise and xs
+    widths = widths_spread * rng.random(tot_gaussians) + width_range[0]
+    # rigid formula to displace centers
     rigidity_div = 2 + (rigidity * 4)**2
-    noise = np.zeros((len(axis2), len(axis1)))
-    xs = np.array([x1s, x2s])
-    # add gaussians
-    for num in range(tot_gaussians):
-        rand1 = np.random.random() - 0.5
-        rand2 = np.random.random() - 0.5
-        center = [
-            centers[num, 0] + (box_length_1 / rigidity_div) * rand1,
-            centers[num, 1] + (box_length_2 / rigidity_div) * rand2]
-        noise += _gaussian_multD(
-            xs, center, height=heights[num], widths=widths[num])
+    displacements = rng.random((tot_gaussians, 2)) - 0.5
+    centers = centers + displacements * \
+        (np.array([box_length_1, box_length_2]) / rigidity_div)
+    return centers, heights, widths
+
+
+def gaussian_noise(
+        x1s, x2s, gaussians_per_axis=None, height_range=[-0.1,0.1],
+        width_range=[0.9,1.1], rigidity=0, rng=None, cutoff=6):
+    """Given x1 coords and x2 coords, generates a specified number of evenly
+       spaced gaussians along each axis of varying height and widths. The
+       rigidity value determines how evenly spaced gaussians are (0 is loose
+       and 1 is rigid). Random numbers are drawn from `rng` (a
+       numpy.random.Generator, or the global numpy.random state if None).
+       Each gaussian is only evaluated within `cutoff` widths of its center
+       (over the whole grid if `cutoff` is None)."""
+    axis1 = x1s[0]
+    axis2 = x2s[:,0]
+    centers, heights, widths = _noise_gaussians(
+        axis1, axis2, gaussians_per_axis=gaussians_per_axis,
+        height_range=height_range, width_range=width_range,
+        rigidity=rigidity, rng=rng)
+    noise = _gaussian_sum(
+        axis1, axis2, centers, heights=heights, widths=widths,
+        cutoff=cutoff)
     return noise
 
 
@@ -171,40 +269,69 @@ def gaussian_noise(
 #######################################################################
 
 
-def energies_to_probs(Aij, energies):
+def _rates_to_probs(
+        from_iis, to_iis, rates, n_states, sparse=False, dtype=None):
+    """Row-normalizes transition rates into a transition probability
+    matrix. Row sums are accumulated in float64 and the probabilities
+    are only cast to `dtype` (the precision policy's float type if None)
+    afterwards, so rows stay normalized in reduced precision."""
+    dtype = precision.get_float_dtype(dtype)
+    rates = np.asarray(rates, dtype=np.float64)
+    row_sums = np.bincount(from_iis, weights=rates, minlength=n_states)
+    probs = (rates / row_sums[from_iis]).astype(dtype)
+    if sparse:
+        T = spar.csr_matrix(
+            (probs, (from_iis, to_iis)), shape=(n_states, n_states))
+    else:
+        T = np.zeros((n_states, n_states), dtype=dtype)
+        T[from_iis, to_iis] = probs
+    return T
+
+
+def energies_to_probs(Aij, energies, dtype=None):
     """Given an adjacency matrix and a list of state energies,
-    returns the corresponding transition probability matrix.
+    returns the corresponding transition probability matrix. All of the
+    Metropolis rates are computed in a single pass over the nonzero
+    elements of Aij. If Aij is a scipy.sparse matrix, the transition
+    probability matrix is returned as a CSR matrix. `dtype` defaults to
+    the float type of the precision policy.
     """
     # test shape of Aij
     fd, sd = Aij.shape
     if fd != sd:
         print("Aij is not square!")
         raise
+    is_sparse = spar.issparse(Aij)
+    Aij = spar.coo_matrix(Aij)
+    Aij.sum_duplicates()
     # test values of Aij
-    if len(np.where((Aij != 0)*(Aij != 1))[0]) > 0:
+    if len(np.where((Aij.data != 0)*(Aij.data != 1))[0]) > 0:
         print("Aij has elements that are not 0 or 1...")
         raise
-    # initialize probs
-    probs = np.zeros(Aij.shape)
-    for state in range(len(probs)):
-        # find where there is a defined transition in Aij
-        transitions = np.where(Aij[state] == 1)[0]
-        # calculates rate = min[1, e^(U1-U2)]
-        rates = np.minimum(
-            np.ones(len(transitions)),
-            np.exp(energies[state] - energies[transitions]))
-        probs[state, transitions] = rates
+    # find where there is a defined transition in Aij
+    transitions = Aij.data == 1
+    from_iis = Aij.row[transitions]
+    to_iis = Aij.col[transitions]
+    # calculates rate = min[1, e^(U1-U2)]
+    energies = np.asarray(energies).flatten()
+    rates = np.minimum(1, np.exp(energies[from_iis] - energies[to_iis]))
     # norms the rates into transition probs
-    probs = probs / probs.sum(axis=1)[:, None]
+    probs = _rates_to_probs(
+        from_iis, to_iis, rates, fd, sparse=is_sparse, dtype=dtype)
     return probs
 
 
-def surface_to_probs(x1s, x2s, surface, grid_size, adjust_centers=True):
+def surface_to_probs(
+        x1s, x2s, surface, grid_size, adjust_centers=True, sparse=False,
+        dtype=None):
     """given a potential energy landscape (in the form of values for x1,
        x2, and f(x1,x2) and a connectivity grid size) returns the transition
        probability matrix that corresponds to that surface. Looks for the
        highest energy between adjacent states and uses the arrhenius equation
-       to generate a rate. Potential energy surface is in units of kT."""
+       to generate a rate. Potential energy surface is in units of kT. If
+       `sparse` is True, a scipy.sparse CSR matrix is built directly from
+       the rates, without ever creating a dense matrix. `dtype` defaults to
+       the float type of the precision policy."""
     # identify number of states and resolution (points between states)
     n_states = grid_size[0]*grid_size[1]
     states = np.arange(n_states).reshape((grid_size[1],grid_size[0]))
@@ -213,8 +340,10 @@ def surface_to_probs(x1s, x2s, surface, grid_size, adjust_centers=True):
         res_adjust = res//2
     else:
         res_adjust = 0
-    # initialize empy probability matrix
-    T = np.zeros((n_states, n_states))
+    # collect the state indices and rates of every transition
+    from_iis = []
+    to_iis = []
+    rates = []
     # Get transitions between columns on the grid
     for col in range(len(states[0])-1):
         # determine the maximum energy between column-adjacent states
@@ -232,10 +361,9 @@ def surface_to_probs(x1s, x2s, surface, grid_size, adjust_centers=True):
         rates2 = np.exp(-energy_diffs_2)
         # get state indices of transitions
         state_trans = states[:,col:col+2].T
-        trans_iis_1 = (state_trans[0], state_trans[1])
-        trans_iis_2 = (state_trans[1], state_trans[0])
-        T[trans_iis_1] = rates1
-        T[trans_iis_2] = rates2
+        from_iis.extend([state_trans[0], state_trans[1]])
+        to_iis.extend([state_trans[1], state_trans[0]])
+        rates.extend([rates1, rates2])
     # Get transitions between rows on the grid
     for row in range(len(states)-1):
         # determine the maximum energy between row-adjacent states
@@ -250,30 +378,86 @@ def surface_to_probs(x1s, x2s, surface, grid_size, adjust_centers=True):
         rates2 = np.exp(-energy_diffs_2)
         # get state indices of transitions
         state_trans = states[row:row+2,:]
-        trans_iis_1 = (state_trans[0], state_trans[1])
-        trans_iis_2 = (state_trans[1], state_trans[0])
-        T[trans_iis_1] = rates1
-        T[trans_iis_2] = rates2
+        from_iis.extend([state_trans[0], state_trans[1]])
+        to_iis.extend([state_trans[1], state_trans[0]])
+        rates.extend([rates1, rates2])
     # Get diagonal transitions
-    T[range(len(T)), range(len(T))] = 1
+    from_iis.append(states.flatten())
+    to_iis.append(states.flatten())
+    rates.append(np.ones(n_states))
+    from_iis = np.concatenate(from_iis)
+    to_iis = np.concatenate(to_iis)
+    rates = np.concatenate(rates)
     # normalize rows and return
-    T /= T.sum(axis=1)[:,None]
+    T = _rates_to_probs(
+        from_iis, to_iis, rates, n_states, sparse=sparse, dtype=dtype)
     return T
 
 
-def gen_aij(grid_size):
-    """Generate a lattice with an arbitrary shape. Returns state
-    numberings and the adjacency matrix."""
-    n_states = np.prod(grid_size)
-    states = np.arange(n_states)
-    l_states = states.reshape(grid_size)
-    iis = np.array(
-        [np.array(np.where(l_states==state)).flatten() for state in states])
-    aij = np.zeros((n_states, n_states), dtype=int)
-    for state in states:
-        diffs = iis - iis[state]
-        dists = np.einsum('ij,ij->i', diffs, diffs)
-        aij[state, np.where(dists<=1)[0]] = 1
+def _lattice_offsets(n_dims, stencil):
+    """The offsets (including zero) of the neighbors of a lattice point.
+    'nearest' connects points that differ by one along a single axis and
+    'diagonal' connects every point in the surrounding 3^n_dims block."""
+    offsets = np.array(list(itertools.product([-1, 0, 1], repeat=n_dims)))
+    if stencil == 'nearest':
+        offsets = offsets[np.sum(np.abs(offsets), axis=1) <= 1]
+    elif stencil != 'diagonal':
+        raise ValueError(
+            "stencil must be 'nearest' or 'diagonal'. Got '%s'." % stencil)
+    return offsets
+
+
+def gen_aij(grid_size, periodic=False, stencil='nearest', sparse=False):
+    """Generate a lattice with an arbitrary shape. Returns the adjacency
+    matrix, where state numbering follows
+    np.arange(n_states).reshape(grid_size).
+
+    Parameters
+    ----------
+    grid_size : tuple
+        The number of lattice points along each dimension.
+    periodic : bool or array-like of bool, default=False
+        Whether the lattice wraps around. Can be specified per dimension.
+    stencil : str, default='nearest'
+        Either 'nearest' for only connecting neighbors along an axis, or
+        'diagonal' to also connect diagonal neighbors.
+    sparse : bool, default=False
+        Optionally return the adjacency matrix as a scipy.sparse CSR
+        matrix. The matrix is built sparsely from the stencil either
+        way.
+
+    Returns
+    ----------
+    aij : array or sparse matrix, shape=(n_states, n_states)
+        The adjacency matrix. States are adjacent to themselves.
+    """
+    grid_size = tuple(np.asarray(grid_size, dtype=int).reshape((-1,)))
+    n_dims = len(grid_size)
+    n_states = int(np.prod(grid_size))
+    periodic = np.zeros(n_dims, dtype=bool) + periodic
+    # lattice coordinates of every state
+    iis = np.array(np.unravel_index(np.arange(n_states), grid_size))
+    from_iis = []
+    to_iis = []
+    for offset in _lattice_offsets(n_dims, stencil):
+        neighbor_iis = iis + offset[:, None]
+        # wrap periodic dimensions and drop neighbors outside the rest
+        neighbor_iis[periodic] %= np.array(grid_size)[periodic][:, None]
+        inside = np.all(
+            (neighbor_iis >= 0) * \
+            (neighbor_iis < np.array(grid_size)[:, None]), axis=0)
+        from_iis.append(np.where(inside)[0])
+        to_iis.append(
+            np.ravel_multi_index(neighbor_iis[:, inside], grid_size))
+    from_iis = np.concatenate(from_iis)
+    to_iis = np.concatenate(to_iis)
+    aij = spar.csr_matrix(
+        (np.ones(len(from_iis), dtype=int), (from_iis, to_iis)),
+        shape=(n_states, n_states))
+    # small periodic dimensions can reach the same neighbor twice
+    aij.data[:] = 1
+    if not sparse:
+        aij = aij.toarray()
     return aij
 
 
@@ -302,49 +486,99 @@ class landscape:
     resolution : int, default=1
         The number of energies to include between states on the grid.
         This serves as a type of resolution of the landscape.
+    dtype : dtype, default=None
+        The float type of a grid being initialized. Defaults to the
+        float type of the precision policy.
     """
 
     def __init__(
             self, grid_size=None,  x1_coords=None, x2_coords=None, values=None,
-            resolution=1):
+            resolution=1, dtype=None):
         if (x1_coords is None) and (x2_coords is None) and (values is None):
             if (grid_size is None):
                 print("Need to specify a grid_size")
                 raise
             self.grid_size = grid_size
+            dtype = precision.get_float_dtype(dtype)
             x1_points = np.arange(grid_size[0]*resolution)/resolution
             x2_points = np.arange(grid_size[1]*resolution)/resolution
-            self.x1_coords, self.x2_coords = np.meshgrid(x1_points, x2_points)
-            self.values = np.zeros(self.x1_coords.shape)
+            self.x1_coords, self.x2_coords = np.meshgrid(
+                x1_points.astype(dtype), x2_points.astype(dtype))
+            self.values = np.zeros(self.x1_coords.shape, dtype=dtype)
         else:
             if (x1_coords is None) or (x2_coords is None) or (values is None):
                 print("missing inputs")
                 raise
-            self.grid_size = (
-                int(x1_coords[0][-1] + x1_coords[0][1]),
-                int(x2_coords[:,0][-1] + x2_coords[:,0][1]))
+            if grid_size is None:
+                grid_size = (
+                    int(x1_coords[0][-1] + x1_coords[0][1]),
+                    int(x2_coords[:,0][-1] + x2_coords[:,0][1]))
+            self.grid_size = grid_size
             self.x1_coords = x1_coords
             self.x2_coords = x2_coords
             self.values = values
 
-    def add_gaussian(self, x0s, height=1, widths=1):
-        input_coords = np.array([self.x1_coords, self.x2_coords])
-        new_values = self.values + _gaussian_multD(
-            input_coords, x0s, height=height, widths=widths)
+    def _with_values(self, new_values, inplace=False):
+        """Returns a landscape with `new_values` on the same grid. If
+        `inplace`, this landscape is updated and returned instead."""
+        if inplace:
+            self.values = new_values
+            return self
         return landscape(
             grid_size=self.grid_size, x1_coords=self.x1_coords,
             x2_coords=self.x2_coords, values=new_values)
 
+    def add_gaussians(
+            self, centers, heights=1, widths=1, cutoff=None, inplace=False):
+        """Adds many gaussians to the landscape in a single pass.
+
+        Parameters
+        ----------
+        centers : array, shape=(n_gaussians, 2)
+            The (x1, x2) center of each gaussian.
+        heights : float or array, shape=(n_gaussians, ), default=1
+            The height of each gaussian.
+        widths : float or array, shape=(n_gaussians, ) or (n_gaussians, 2)
+            The width of each gaussian, optionally per dimension.
+        cutoff : float, default=None
+            Optionally only evaluate each gaussian within this many widths
+            of its center. This makes the cost scale with the number of
+            grid points rather than grid points times gaussians.
+        inplace : bool, default=False
+            Optionally add the gaussians to this landscape's values
+            instead of returning a new landscape.
+
+        Returns
+        ----------
+        landscape : landscape object
+            The landscape with gaussians added.
+        """
+        if inplace:
+            new_values = self.values
+        else:
+            new_values = np.array(
+                self.values, dtype=np.result_type(self.values, np.float32))
+        new_values = _gaussian_sum(
+            self.x1_coords[0], self.x2_coords[:,0], centers, heights=heights,
+            widths=widths, cutoff=cutoff, out=new_values)
+        return self._with_values(new_values, inplace=inplace)
+
+    def add_gaussian(self, x0s, height=1, widths=1, inplace=False):
+        return self.add_gaussians(
+            [x0s], heights=height, widths=np.reshape(widths, (1, -1)),
+            inplace=inplace)
+
     def add_noise(
             self, gaussians_per_axis=None, height_range=[-0.1, 0.1],
-            width_range=[0.85, 1.15], rigidity=0):
-        noise = gaussian_noise(
-            self.x1_coords, self.x2_coords,
+            width_range=[0.85, 1.15], rigidity=0, rng=None, cutoff=6,
+            inplace=False):
+        centers, heights, widths = _noise_gaussians(
+            self.x1_coords[0], self.x2_coords[:,0],
             gaussians_per_axis = gaussians_per_axis, height_range = height_range,
-            width_range = width_range, rigidity = rigidity)
-        return landscape(
-            grid_size=self.grid_size, x1_coords=self.x1_coords,
-            x2_coords=self.x2_coords, values=self.values+noise)
+            width_range = width_range, rigidity = rigidity, rng = rng)
+        return self.add_gaussians(
+            centers, heights=heights, widths=widths, cutoff=cutoff,
+            inplace=inplace)
 
     def plot(
             self, title='potential energy landscape', cmap='seismic',
@@ -433,31 +667,127 @@ class landscape:
         plt.savefig(output_name)
         plt.show()
 
-    def to_probs(self):
-        T = surface_to_probs(
-            self.x1_coords, self.x2_coords, self.values, self.grid_size)
+    def to_probs(self, sparse=False, cache=None, dtype=None):
+        """Returns the transition probability matrix of the landscape.
+        If `sparse` is True, a scipy.sparse CSR matrix is returned. If a
+        caching.probs_cache is given (or set as the default cache), the
+        matrix is looked up by a hash of the landscape before being
+        built. Cached matrices are read-only. `dtype` defaults to the float
+        type of the precision policy."""
+        dtype = precision.get_float_dtype(dtype)
+        if cache is None:
+            cache = caching.get_default_cache()
+        if cache is None:
+            return surface_to_probs(
+                self.x1_coords, self.x2_coords, self.values, self.grid_size,
+                sparse=sparse, dtype=dtype)
+        key = caching.probs_key(
+            self.x1_coords, self.x2_coords, self.values, self.grid_size,
+            adjust_centers=True, sparse=sparse, dtype=dtype.str)
+        T = cache.get_or_compute(
+            key, lambda: surface_to_probs(
+                self.x1_coords, self.x2_coords, self.values, self.grid_size,
+                sparse=sparse, dtype=dtype))
         return T
 
-    def save(self, output_name, txt=False, txt_fmt='%d %d %d %f'):
+    def save(
+            self, output_name, txt=False, txt_fmt='%d %d %d %f',
+            native=False, probs=None):
+        """Saves the landscape.
+
+        By default, the landscape is written to an h5 file with
+        mdtraj.io.saveh. With `native`, it is instead written to the
+        directory `output_name` in a native format: the coordinates are
+        stored implicitly as an origin, spacing, and shape in
+        `info.json`, and the energies as `values.npy`, which `load`
+        memory-maps.
+
+        Parameters
+        ----------
+        output_name : str
+            The output h5 file (or directory or text file).
+        txt : bool, default=False
+            Optionally write a text file of states, coordinates, and
+            energies.
+        txt_fmt : str, default='%d %d %d %f'
+            The format of each line of the text file.
+        native : bool, default=False
+            Optionally write the native format to a directory.
+        probs : bool or matrix, default=None
+            Optionally bundle a transition probability matrix with the
+            native format. If True, the sparse matrix from `to_probs` is
+            stored.
+        """
+        if (probs is not None) and (probs is not False) and not native:
+            raise ValueError(
+                "Transition probabilities can only be bundled with the "
+                "native format.")
         if txt:
-            x1_coords_flat = self.x1_coords.flatten()
-            x2_coords_flat = self.x2_coords.flatten()
-            values_flat = self.values.flatten()
-            states = np.arange(len(x1_coords_flat))
-            output_data = np.array(
-                list(
-                    zip(states, x1_coords_flat, x2_coords_flat, values_flat)))
-            np.savetxt(
-                output_name, output_data, fmt=txt_fmt,
-                header='state x1 x2 energy')
-        else:
+            output_data = np.column_stack(
+                [
+                    np.arange(self.values.size), self.x1_coords.flatten(),
+                    self.x2_coords.flatten(), self.values.flatten()])
+            line_fmt = txt_fmt + '\n'
+            with open(output_name, 'w') as f:
+                f.write('# state x1 x2 energy\n')
+                # format many lines per write instead of one at a time
+                for start in range(0, len(output_data), 2**16):
+                    chunk = output_data[start:start + 2**16]
+                    f.write((line_fmt * len(chunk)) % tuple(chunk.flatten()))
+        elif not native:
+            from mdtraj import io
             output_dict = {
                 'x1_coords' : self.x1_coords,
                 'x2_coords' : self.x2_coords,
                 'landscape' : self.values}
             io.saveh(output_name, **output_dict)
-
-    def load(input_name):
+        else:
+            os.makedirs(output_name, exist_ok=True)
+            x1_points = self.x1_coords[0]
+            x2_points = self.x2_coords[:,0]
+            # an axis with a single point has no spacing, so it is
+            # taken from the grid size
+            spacing = [
+                float(points[1] - points[0]) if len(points) > 1
+                else float(grid_size) / len(points)
+                for points, grid_size in zip(
+                    [x1_points, x2_points], self.grid_size)]
+            info = {
+                'grid_size': [int(g) for g in self.grid_size],
+                'origin': [float(x1_points[0]), float(x2_points[0])],
+                'spacing': spacing,
+                'shape': [int(i) for i in self.values.shape]}
+            np.save(os.path.join(output_name, 'values.npy'), self.values)
+            if probs is True:
+                probs = self.to_probs(sparse=True)
+            if (probs is not None) and (probs is not False):
+                probs = spar.csr_matrix(probs)
+                for name in ['data', 'indices', 'indptr']:
+                    np.save(
+                        os.path.join(output_name, 'T_%s.npy' % name),
+                        getattr(probs, name))
+            with open(os.path.join(output_name, 'info.json'), 'w') as f:
+                json.dump(info, f)
+
+    def load(input_name, mmap_mode='c'):
+        """Loads a landscape written by `save`. Native landscapes are
+        memory-mapped (copy-on-write by default), so loading does not
+        read the energies until they are used and processes share pages.
+        The coordinates are broadcast views of the two axes."""
+        if os.path.isdir(input_name):
+            with open(os.path.join(input_name, 'info.json')) as f:
+                info = json.load(f)
+            values = np.load(
+                os.path.join(input_name, 'values.npy'), mmap_mode=mmap_mode)
+            n_x2, n_x1 = info['shape']
+            x1_points = info['origin'][0] + info['spacing'][0]*np.arange(n_x1)
+            x2_points = info['origin'][1] + info['spacing'][1]*np.arange(n_x2)
+            x1_coords, x2_coords = np.meshgrid(
+                x1_points, x2_points, copy=False)
+            return landscape(
+                grid_size=tuple(info['grid_size']), x1_coords=x1_coords,
+                x2_coords=x2_coords, values=values)
+        from mdtraj import io
         load_dict = io.loadh(input_name)
         x1_coords = load_dict['x1_coords']
         x2_coords = load_dict['x2_coords']
@@ -465,6 +795,160 @@ class landscape:
         return landscape(
             x1_coords=x1_coords, x2_coords=x2_coords, values=values)
 
+    def lazy(self):
+        """Returns a lazy_landscape recipe starting from this landscape's
+        values."""
+        resolution = len(self.x1_coords[0]) // self.grid_size[0]
+        return lazy_landscape(
+            grid_size=self.grid_size, resolution=resolution,
+            base_values=self.values)
+
+
+class lazy_landscape:
+    """A recipe for a landscape. Operations are recorded instead of being
+    applied, and the recipe is evaluated in a single fused pass (in
+    chunks of rows) only when the values are needed, i.e. by `values`,
+    `to_probs()`, or `save()`. The same recipe can be evaluated at any
+    resolution with `evaluate`.
+
+    Parameters
+    ----------
+    grid_size : tuple
+        The dimensions of the 2d landscape. i.e. for a landscape that
+        is 50x10, grid_size=(50,10).
+    resolution : int, default=1
+        The resolution used when accessing `values`, `to_probs()`, or
+        `save()`. Noise parameters are also drawn on this grid.
+    base_values : array, default=None
+        Optional starting energies. The recipe can then only be
+        evaluated at the resolution of these values.
+    ops : tuple, default=()
+        The recorded operations. Each is a tuple of
+        (centers, heights, widths, cutoff) of a set of gaussians.
+    """
+
+    def __init__(self, grid_size, resolution=1, base_values=None, ops=()):
+        self.grid_size = grid_size
+        self.resolution = resolution
+        self.base_values = base_values
+        self.ops = tuple(ops)
+        self._landscape = None
+
+    def _axes(self, resolution):
+        x1_points = np.arange(self.grid_size[0]*resolution)/resolution
+        x2_points = np.arange(self.grid_size[1]*resolution)/resolution
+        return x1_points, x2_points
+
+    def _record(self, op):
+        return lazy_landscape(
+            grid_size=self.grid_size, resolution=self.resolution,
+            base_values=self.base_values, ops=self.ops + (op,))
+
+    def add_gaussians(self, centers, heights=1, widths=1, cutoff=None):
+        """Records adding gaussians. See landscape.add_gaussians."""
+        op = (
+            np.array(centers, dtype=float).reshape((-1, 2)),
+            np.array(heights, dtype=float), np.array(widths, dtype=float),
+            cutoff)
+        return self._record(op)
+
+    def add_gaussian(self, x0s, height=1, widths=1):
+        return self.add_gaussians(
+            [x0s], heights=height, widths=np.reshape(widths, (1, -1)))
+
+    def add_noise(
+            self, gaussians_per_axis=None, height_range=[-0.1, 0.1],
+            width_range=[0.85, 1.15], rigidity=0, rng=None, cutoff=6):
+        """Records adding noise. The noise gaussians are drawn now, so
+        every evaluation of the recipe has the same noise."""
+        x1_points, x2_points = self._axes(self.resolution)
+        centers, heights, widths = _noise_gaussians(
+            x1_points, x2_points,
+            gaussians_per_axis = gaussians_per_axis, height_range = height_range,
+            width_range = width_range, rigidity = rigidity, rng = rng)
+        return self.add_gaussians(
+            centers, heights=heights, widths=widths, cutoff=cutoff)
+
+    def evaluate(self, resolution=None, chunk_rows=None, dtype=None):
+        """Evaluates the recipe.
+
+        Parameters
+        ----------
+        resolution : int, default=None
+            The resolution to evaluate at. Defaults to the resolution of
+            the recipe.
+        chunk_rows : int, default=None
+            The number of grid rows evaluated at a time. By default, rows
+            are chunked into blocks of about 2**20 points.
+        dtype : dtype, default=None
+            The float type of the values. Defaults to the float type of
+            the precision policy.
+
+        Returns
+        ----------
+        landscape : landscape object
+            The evaluated landscape.
+        """
+        if resolution is None:
+            resolution = self.resolution
+        if (self.base_values is not None) and \
+                (resolution != self.resolution):
+            raise ValueError(
+                "A recipe with base values can only be evaluated at "
+                "resolution %d." % self.resolution)
+        x1_points, x2_points = self._axes(resolution)
+        if chunk_rows is None:
+            chunk_rows = max(2**20 // len(x1_points), 1)
+        values = np.zeros(
+            (len(x2_points), len(x1_points)),
+            dtype=precision.get_float_dtype(dtype))
+        for start in range(0, len(x2_points), chunk_rows):
+            rows = slice(start, start + chunk_rows)
+            block = values[rows]
+            if self.base_values is not None:
+                block += self.base_values[rows]
+            for centers, heights, widths, cutoff in self.ops:
+                _gaussian_sum(
+                    x1_points, x2_points[rows], centers, heights=heights,
+                    widths=widths, cutoff=cutoff, out=block)
+        l = landscape(
+            grid_size=self.grid_size, resolution=resolution,
+            dtype=values.dtype)
+        l.values = values
+        return l
+
+    def _evaluated(self):
+        if self._landscape is None:
+            self._landscape = self.evaluate()
+        return self._landscape
+
+    @property
+    def values(self):
+        return self._evaluated().values
+
+    def to_probs(self, *args, **kwargs):
+        return self._evaluated().to_probs(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        return self._evaluated().save(*args, **kwargs)
+
+
+def load_probs(input_name, mmap_mode='r'):
+    """Returns the transition probability matrix bundled with a landscape
+    saved in the native format, as a memory-mapped CSR matrix, or None if
+    no matrix was saved."""
+    filenames = [
+        os.path.join(input_name, 'T_%s.npy' % name)
+        for name in ['data', 'indices', 'indptr']]
+    if not os.path.exists(filenames[0]):
+        return None
+    data, indices, indptr = [
+        np.load(filename, mmap_mode=mmap_mode) for filename in filenames]
+    n_states = len(indptr) - 1
+    return spar.csr_matrix(
+        (data, indices, indptr), shape=(n_states, n_states), copy=False)
+
+
 def removekey(d, key):
     r = dict(d)
     del r[key]
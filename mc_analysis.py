@@ -1,4 +1,5 @@
 import numpy as np
+from . import kernels
 
 def _get_reactive_path(assignment, sinks, source=None):
     """Given a trajectory, determines the string of states that goes
@@ -30,8 +31,10 @@ def reactive_pathways(assignments, sinks, source=None, verbose=False):
     pathways, i.e. the trajectories of going from source to sink.
     """
     sinks = np.array(sinks).reshape((-1,))
-    pathways = np.array(
-        [_get_reactive_path(assignment, sinks) for assignment in assignments])
+    # pathways have different lengths, so they are stored as objects
+    pathways = np.empty(len(assignments), dtype=object)
+    for num, assignment in enumerate(assignments):
+        pathways[num] = _get_reactive_path(assignment, sinks)
 
     # trim empty pathways
     pathway_lengths = np.array([len(pathway) for pathway in pathways])
@@ -57,8 +60,10 @@ def reactive_density(
     else:
         pathways = assignments
 
-    state_counts = np.array(
-        np.bincount(np.concatenate(pathways)))
+    # negative frames (i.e. rounds after a stop condition) are missing
+    # data
+    frames = np.concatenate(pathways)
+    state_counts = np.array(np.bincount(frames[frames >= 0]))
     densities = state_counts / np.sum(state_counts)
 
     return densities
@@ -77,9 +82,9 @@ def state_pathway_prob(
     else:
         pathways = assignments
 
-    unique_pathways = np.array(
-        [np.unique(pathway) for pathway in pathways])
-    state_counts = np.array(np.bincount(np.concatenate(unique_pathways)))
+    unique_pathways = [np.unique(pathway) for pathway in pathways]
+    frames = np.concatenate(unique_pathways)
+    state_counts = np.array(np.bincount(frames[frames >= 0]))
     pathway_probs = state_counts / len(unique_pathways)
 
     return pathway_probs
@@ -102,8 +107,9 @@ def _condition_assignments(assignments, end_state, flatten=True):
     for ii in state_doesnt_exist_iis:
         conditioned_assignments.append(assignments[ii])
     if flatten:
-        flattened_assignments = np.array(
-            [ass.flatten() for ass in conditioned_assignments])
+        # rows are cut at different frames, so they are kept as a list
+        flattened_assignments = [
+            ass.flatten() for ass in conditioned_assignments]
         assignments_out = flattened_assignments
     else:
         assignments_out = conditioned_assignments
@@ -113,16 +119,16 @@ def _condition_assignments(assignments, end_state, flatten=True):
 def discover_probabilities(assignments, n_states=None, end_state=None):
     """Returns the probability that a state is discovered from a set
     of trajectories or sampling run (treats each row in assignments as
-    an independent sampling run for calculating probabilities)"""
+    an independent sampling run for calculating probabilities).
+    Negative frames, i.e. the rounds that were not simulated after a
+    stop condition was met, are ignored."""
     if n_states is None:
-        n_states = np.max(np.flatten(assignments))
+        # a Python int, since compact assignments (i.e. int8) would
+        # overflow when the largest state is the largest of the type
+        n_states = int(np.max(assignments)) + 1
     if end_state is not None and assignments.shape:
         assignments = _condition_assignments(assignments, end_state)
-    if len(assignments.shape) > 2:
-        assignments = np.array([ass.flatten() for ass in assignments])
-    observed_states = np.array(
-        [
-            np.bincount(ass, minlength=n_states) for ass in assignments]) > 0
+    observed_states = kernels.observed_states(assignments, n_states)
     discover_probs = np.sum(observed_states, axis=0) / len(assignments)
     return discover_probs
     
@@ -1,36 +1,520 @@
+import copy
+import inspect
 import itertools
+import json
 import numpy as np
-from . import rankings
+import os
+import pickle
+import scipy.sparse as spar
+import shutil
+import tempfile
+from . import executors, kernels, precision, rankings
 from enspara.msm import builders, MSM
 from functools import partial
-from multiprocessing import Pool
+
+
+def _sampling_tables(T, float_dtype=np.float64, state_dtype=int):
+    """Builds padded per-row destination and cumulative probability
+    tables from the nonzero entries of a CSR matrix. Rows without any
+    entries map back onto their own state. Cumulative sums are computed
+    in float64 and only cast to `float_dtype` at the end."""
+    n_rows = T.shape[0]
+    row_iis = np.arange(n_rows)
+    row_lengths = np.diff(T.indptr)
+    max_k = max(row_lengths.max(), 1)
+    # position of each nonzero within its row
+    nnz_rows = np.repeat(row_iis, row_lengths)
+    nnz_ks = np.arange(len(T.data)) - np.repeat(T.indptr[:-1], row_lengths)
+    probs = np.zeros((n_rows, max_k))
+    probs[nnz_rows, nnz_ks] = T.data.astype(np.float64)
+    cols = np.repeat(row_iis[:, None], max_k, axis=1)
+    cols[nnz_rows, nnz_ks] = T.indices
+    # pad destinations with the last destination of each row
+    last_ks = np.maximum(row_lengths - 1, 0)
+    pad = np.arange(max_k)[None, :] >= row_lengths[:, None]
+    cols = np.where(pad, cols[row_iis, last_ks][:, None], cols)
+    # renormalize each row so the last cumulative value is exactly 1
+    cdf = np.cumsum(probs, axis=1)
+    totals = cdf[row_iis, last_ks]
+    totals[row_lengths == 0] = 1
+    cdf /= totals[:, None]
+    cdf[row_iis, last_ks] = 1
+    cdf[pad] = 1
+    return cols.astype(state_dtype), cdf.astype(float_dtype)
+
+
+class TransitionSampler:
+    """Per-row sampling tables for a transition probability matrix.
+    Only the nonzero transitions of each row are stored, padded to the
+    row with the most transitions, so that drawing the next state of a
+    lattice state costs O(log k) for k nonzero transitions instead of
+    O(n_states).
+
+    Parameters
+    ----------
+    T : array or sparse matrix, shape=(n_states, n_states)
+        The transition probability matrix from which to sample.
+    dtype : dtype, default=None
+        The float type of the cumulative probability tables. Defaults to
+        the float type of the precision policy. The integer type of the
+        tables and of the trajectories follows the policy's
+        compact_states setting.
+
+    Attributes
+    ----------
+    cols : array, shape=(n_states, max_k)
+        The destination states of each row. Padding repeats the last
+        destination of the row.
+    cdf : array, shape=(n_states, max_k)
+        The cumulative transition probabilities of each row. Padding is
+        set to 1 so that it is never selected.
+
+    Samplers loaded with `TransitionSampler.load` are memory-mapped and
+    are pickled as a reference to their directory, so they can be sent
+    to worker processes without copying the tables.
+    """
+
+    def __init__(self, T, dtype=None):
+        T = spar.csr_matrix(T)
+        # csr_matrix does not copy a CSR input, so T is copied before
+        # it is cleaned up in place. This leaves the caller's matrix
+        # untouched and also works on read-only (i.e. cached or
+        # memory-mapped) matrices.
+        if (not T.has_sorted_indices) or np.any(T.data == 0):
+            T = T.copy()
+            T.eliminate_zeros()
+            T.sort_indices()
+        self.n_states = T.shape[1]
+        if np.any(np.diff(T.indptr) == 0):
+            raise ValueError("T has rows without any transitions.")
+        self.float_dtype = precision.get_float_dtype(dtype)
+        self.state_dtype = precision.get_state_dtype(self.n_states)
+        self.cols, self.cdf = _sampling_tables(
+            T, float_dtype=self.float_dtype, state_dtype=self.state_dtype)
+        self._exit_tables = None
+        self._source = None
+
+    def __getstate__(self):
+        if self._source is not None:
+            return {'_source': self._source}
+        return self.__dict__
+
+    def __setstate__(self, state):
+        if set(state) == {'_source'}:
+            state = TransitionSampler.load(*state['_source']).__dict__
+        self.__dict__.update(state)
+
+    def save(self, output_dir):
+        """Writes the sampling tables, and the exit tables if they have
+        been built, to a directory of .npy files."""
+        os.makedirs(output_dir, exist_ok=True)
+        arrays = {'cols': self.cols, 'cdf': self.cdf}
+        if self._exit_tables is not None:
+            arrays.update(
+                zip(['exit_probs', 'exit_cols', 'exit_cdf'],
+                    self._exit_tables))
+        for name, array in arrays.items():
+            np.save(os.path.join(output_dir, name + '.npy'), array)
+        with open(os.path.join(output_dir, 'info.json'), 'w') as f:
+            json.dump({'n_states': int(self.n_states)}, f)
+
+    def load(input_dir, mmap_mode='r'):
+        """Loads sampling tables written by `save`. Tables are
+        memory-mapped by default, so processes that load the same
+        directory share a single copy."""
+        with open(os.path.join(input_dir, 'info.json')) as f:
+            info = json.load(f)
+        arrays = {}
+        for name in ['cols', 'cdf', 'exit_probs', 'exit_cols', 'exit_cdf']:
+            filename = os.path.join(input_dir, name + '.npy')
+            if os.path.exists(filename):
+                arrays[name] = np.load(filename, mmap_mode=mmap_mode)
+        sampler = TransitionSampler.__new__(TransitionSampler)
+        sampler.n_states = info['n_states']
+        sampler.cols = arrays['cols']
+        sampler.cdf = arrays['cdf']
+        sampler.float_dtype = sampler.cdf.dtype
+        sampler.state_dtype = sampler.cols.dtype
+        sampler._exit_tables = None
+        if 'exit_cdf' in arrays:
+            sampler._exit_tables = (
+                arrays['exit_probs'], arrays['exit_cols'],
+                arrays['exit_cdf'])
+        sampler._source = None
+        if mmap_mode is not None:
+            sampler._source = (os.path.abspath(input_dir), mmap_mode)
+        return sampler
+
+    def exit_tables(self):
+        """The probability of leaving each state and the sampling tables
+        of the moves away from it (the self-transition removed). These
+        are only needed for dwell-time skipping and are built on first
+        use."""
+        if self._exit_tables is None:
+            # recover the probabilities of the moves away from each
+            # state from the sampling tables
+            probs = np.diff(
+                np.array(self.cdf, dtype=np.float64), axis=1, prepend=0)
+            rows = np.repeat(
+                np.arange(len(self.cols))[:, None], self.cols.shape[1],
+                axis=1)
+            moves = (self.cols != rows) * (probs > 0)
+            off_diag = spar.csr_matrix(
+                (probs[moves], (rows[moves], self.cols[moves])),
+                shape=(len(self.cols), self.n_states))
+            exit_probs = np.array(off_diag.sum(axis=1)).flatten()
+            exit_cols, exit_cdf = _sampling_tables(
+                off_diag, float_dtype=self.float_dtype,
+                state_dtype=self.state_dtype)
+            self._exit_tables = (exit_probs, exit_cols, exit_cdf)
+        return self._exit_tables
+
+    def step(self, state, u):
+        """The next state from `state` given a uniform random number
+        `u` in [0, 1)."""
+        k = np.searchsorted(self.cdf[state], u, side='right')
+        return self.cols[state, k]
+
+    def traj(
+            self, n_steps, start_state, rng=np.random.default_rng(),
+            skip_self=False):
+        """A trajectory of `n_steps` states starting from
+        `start_state`."""
+        if skip_self:
+            return self.trajs(n_steps, [start_state], rng, skip_self)[0]
+        us = rng.random(n_steps - 1)
+        if kernels.get_backend() == 'numba':
+            return kernels.trajs_from_tables(
+                self.cols, self.cdf, [start_state], us[:, None])[0]
+        traj = np.zeros(n_steps, dtype=self.state_dtype)
+        traj[0] = start_state
+        cols = self.cols
+        cdf = self.cdf
+        state = start_state
+        for i in range(n_steps - 1):
+            k = np.searchsorted(cdf[state], us[i], side='right')
+            state = cols[state, k]
+            traj[i+1] = state
+        return traj
+
+    def trajs(
+            self, n_steps, start_states, rng=np.random.default_rng(),
+            skip_self=False, out=None):
+        """Trajectories of `n_steps` states for every state in
+        `start_states`. All walkers are advanced together, so each step
+        is a single vectorized lookup. Trajectories are written into
+        `out` if it is given."""
+        start_states = np.asarray(start_states).reshape((-1,))
+        if skip_self:
+            trajs = self._dwell_trajs(n_steps, start_states, rng)
+            if out is None:
+                return trajs
+            out[:] = trajs
+            return out
+        us = rng.random((n_steps - 1, len(start_states)))
+        return kernels.trajs_from_tables(
+            self.cols, self.cdf, start_states, us, out=out)
+
+    def _dwell_trajs(self, n_steps, start_states, rng):
+        """Trajectories generated one dwell at a time. The number of
+        frames spent in a state before leaving it is geometric with the
+        exit probability as its success rate, and the move that ends the
+        dwell is drawn from the off-diagonal transitions. This has the
+        same distribution as stepping one frame at a time."""
+        exit_probs, exit_cols, exit_cdf = self.exit_tables()
+        n_walkers = len(start_states)
+        states = np.array(start_states, dtype=int)
+        times = np.zeros(n_walkers, dtype=int)
+        dwell_states = []
+        dwell_lengths = []
+        active = times < n_steps
+        while np.any(active):
+            # draw how long each active walker stays in its state.
+            # Walkers that cannot leave stay for the rest of the
+            # trajectory.
+            lengths = np.zeros(n_walkers, dtype=int)
+            ps = exit_probs[states[active]]
+            lengths_active = np.zeros(len(ps), dtype=int) + n_steps
+            can_exit = ps > 0
+            lengths_active[can_exit] = rng.geometric(ps[can_exit])
+            lengths[active] = lengths_active
+            dwell_states.append(np.copy(states))
+            dwell_lengths.append(lengths)
+            times += lengths
+            active = times < n_steps
+            # move the walkers that are still active out of their state
+            moving = states[active]
+            us = rng.random(len(moving))
+            ks = np.sum(exit_cdf[moving] <= us[:, None], axis=1)
+            states[active] = exit_cols[moving, ks]
+        # truncate the last dwell of each walker at n_steps and expand
+        dwell_states = np.array(dwell_states).T
+        dwell_lengths = np.array(dwell_lengths).T
+        ends = np.cumsum(dwell_lengths, axis=1)
+        dwell_lengths = np.clip(
+            n_steps - (ends - dwell_lengths), 0, dwell_lengths)
+        trajs = np.repeat(dwell_states.flatten(), dwell_lengths.flatten())
+        return trajs.reshape((n_walkers, n_steps)).astype(self.state_dtype)
 
 
 # A more efficient implementation of synthetic trajectory for speed
 # note order flip in args
-def synth_traj(t_probs, n_steps, start_state, rng=np.random.default_rng()):
-    traj = np.zeros(n_steps, dtype=int)
-    traj[0] = start_state
-    nstates = t_probs.shape[1]
-    for i in range(n_steps -1):
-        traj[i+1] = rng.choice(nstates, 1, p=t_probs[traj[i], :])
-    return traj
-
-def _run_sampling(adaptive_sampling_obj):
+def synth_traj(
+        t_probs, n_steps, start_state, rng=np.random.default_rng(),
+        skip_self=False):
+    """Generates a synthetic trajectory. `t_probs` can either be a
+    transition probability matrix or a TransitionSampler. When
+    generating many trajectories from the same matrix, pass a
+    TransitionSampler so that the sampling tables are only built
+    once. With `skip_self`, self-transitions are skipped by drawing
+    the length of each dwell in a single draw."""
+    if not isinstance(t_probs, TransitionSampler):
+        t_probs = TransitionSampler(t_probs)
+    return t_probs.traj(n_steps, start_state, rng=rng, skip_self=skip_self)
+
+
+def synth_trajs(
+        t_probs, n_steps, start_states, rng=np.random.default_rng(),
+        skip_self=False, out=None):
+    """Generates a synthetic trajectory for each state in
+    `start_states` by advancing all of the walkers in lockstep.
+
+    Parameters
+    ----------
+    t_probs : array, sparse matrix, or TransitionSampler
+        The transition probability matrix from which to sample.
+    n_steps : int
+        The number of states in each trajectory.
+    start_states : array-like, shape=(n_trajs, )
+        The starting state of each trajectory.
+    rng : numpy.random.Generator
+        The random number generator to draw from.
+    skip_self : bool, default=False
+        Optionally draw the number of self-transitions from each state
+        from a geometric distribution instead of stepping through
+        them. The trajectories have the same distribution either way,
+        but this is much faster when self-transitions dominate.
+    out : array, shape=(n_trajs, n_steps), default=None
+        Optionally write the trajectories into this array, i.e. a view
+        of a larger preallocated buffer.
+
+    Returns
+    ----------
+    trajs : array, shape=(n_trajs, n_steps)
+        The synthetic trajectories.
+    """
+    if not isinstance(t_probs, TransitionSampler):
+        t_probs = TransitionSampler(t_probs)
+    return t_probs.trajs(
+        n_steps, start_states, rng=rng, skip_self=skip_self, out=out)
+
+class _shared_sampler:
+    """Context manager that builds the sampling tables of T once and
+    writes them to memory-mapped files in a temporary directory. The
+    memory-mapped sampler it returns is pickled as the path to the
+    tables, so tasks sent to workers do not carry a copy of T. The
+    directory is removed on exit. T may also be a TransitionSampler,
+    which is written as is, or returned unchanged if it is already
+    memory-mapped."""
+
+    def __init__(self, T, skip_self=False, tmp_dir=None):
+        self.T = T
+        self.skip_self = skip_self
+        self.tmp_dir = tmp_dir
+
+    def __enter__(self):
+        self._dir = None
+        if isinstance(self.T, TransitionSampler):
+            sampler = self.T
+            # memory-mapped samplers are already shared, i.e. by an
+            # enclosing _shared_sampler
+            if (sampler._source is not None) and \
+                    ((not self.skip_self) or
+                        (sampler._exit_tables is not None)):
+                return sampler
+        else:
+            sampler = TransitionSampler(self.T)
+        if self.skip_self:
+            sampler.exit_tables()
+        self._dir = tempfile.mkdtemp(prefix='slandscapes-', dir=self.tmp_dir)
+        try:
+            sampler.save(self._dir)
+            return TransitionSampler.load(self._dir)
+        except BaseException:
+            shutil.rmtree(self._dir)
+            raise
+
+    def __exit__(self, *args):
+        if self._dir is not None:
+            shutil.rmtree(self._dir)
+
+
+def _n_states(T):
+    """The number of states of a transition matrix or sampler."""
+    if isinstance(T, TransitionSampler):
+        return T.n_states
+    return T.shape[0]
+
+
+def _rep_seeds(seed, n_reps):
+    """Spawns an independent seed sequence for each rep from a master
+    seed, so that every rep only depends on `seed` and its index."""
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return seed.spawn(n_reps)
+
+
+def _select_states(ranking_obj, msm, n_clones, rng):
+    """Selects states with a rankings object, passing on `rng` if its
+    select_states accepts one."""
+    parameters = inspect.signature(ranking_obj.select_states).parameters
+    if 'rng' in parameters:
+        return ranking_obj.select_states(msm, n_clones, rng=rng)
+    return ranking_obj.select_states(msm, n_clones)
+
+
+def _atomic_write(filename, write):
+    """Calls `write` with a temporary file next to `filename` and
+    renames it into place, so a preempted write never leaves a partial
+    file behind."""
+    fd, tmp_name = tempfile.mkstemp(
+        prefix='.tmp-', dir=os.path.dirname(os.path.abspath(filename)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_name, filename)
+    finally:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+
+def _checkpoint_names(checkpoint_dir, rep_num):
+    """The checkpoint of a rep in progress and its finished output."""
+    base = os.path.join(checkpoint_dir, 'rep%06d' % rep_num)
+    return base + '.pkl', base + '.npy'
+
+
+def _discovery_name(filename):
+    return os.path.splitext(filename)[0] + '_discovery.npy'
+
+
+def _check_run_parameters(checkpoint_dir, parameters):
+    """Records the parameters of a checkpointed call in
+    `checkpoint_dir`, or checks them against those already recorded, so
+    that reps from a different call are never reused."""
+    filename = os.path.join(checkpoint_dir, 'parameters.json')
+    if not os.path.exists(filename):
+        _atomic_write(
+            filename, lambda f: f.write(json.dumps(parameters).encode()))
+        return
+    with open(filename) as f:
+        recorded = json.load(f)
+    if recorded != parameters:
+        changed = sorted(
+            key for key in set(recorded) | set(parameters)
+            if recorded.get(key) != parameters.get(key))
+        raise ValueError(
+            "Checkpoint directory %s is from a call with different %s. "
+            "Use a new directory." % (checkpoint_dir, ', '.join(changed)))
+
+
+def _run_sampling(sampling_info):
     """Helper to adaptive sampling. Helps parallelize sampling runs."""
-    assignments = adaptive_sampling_obj[0].run()
-    return assignments
+    (adaptive_sampling_obj, rep_num, seed_seq, checkpoint_dir,
+        checkpoint_interval) = sampling_info
+    # every rep fits and ranks with its own copies, so that reps can
+    # share a process or run on threads
+    adaptive_sampling_obj = copy.copy(adaptive_sampling_obj)
+    adaptive_sampling_obj.msm_obj = copy.deepcopy(
+        adaptive_sampling_obj.msm_obj)
+    adaptive_sampling_obj.ranking_obj = copy.deepcopy(
+        adaptive_sampling_obj.ranking_obj)
+    checkpoint = None
+    if checkpoint_dir is not None:
+        checkpoint, finished = _checkpoint_names(checkpoint_dir, rep_num)
+    assignments = adaptive_sampling_obj.run(
+        rng=np.random.default_rng(seed_seq), checkpoint=checkpoint,
+        checkpoint_interval=checkpoint_interval)
+    discovery = adaptive_sampling_obj.discovery_
+    if checkpoint_dir is not None:
+        # finished reps only keep their assignments and discovery. The
+        # assignments are written last, since they mark the rep as done.
+        _atomic_write(
+            _discovery_name(finished), lambda f: np.save(f, discovery))
+        _atomic_write(finished, lambda f: np.save(f, assignments))
+        # runs without any rounds after the initial one never write a
+        # checkpoint
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+    return rep_num, assignments, discovery
+
+
+class incremental_msm:
+    """Wraps an enspara MSM object so that trajectories can be added a
+    round at a time. A running sparse count matrix is kept and only the
+    transitions of new trajectories are counted, instead of re-counting
+    every trajectory on each fit. Exposes the same `tcounts_`, `tprobs_`
+    and `eq_probs_` attributes as the MSM object, so it can be passed to
+    rankings objects.
+
+    Parameters
+    ----------
+    msm_obj : enspara.msm.MSM object
+        Provides the lag time, number of states, and the method used to
+        build the transition probability matrix from counts. Trimming
+        is not supported.
+    """
+
+    def __init__(self, msm_obj):
+        if msm_obj.trim:
+            raise ValueError(
+                "Incremental counting does not support trimmed MSMs.")
+        self.msm_obj = msm_obj
+        self.lag_time = msm_obj.lag_time
+        self.method = msm_obj.method
+        self.max_n_states = msm_obj.max_n_states
+        self.counts = None
+
+    def fit(self, assigns):
+        """Discards any counts and fits `assigns` from scratch."""
+        self.counts = None
+        return self.partial_fit(assigns)
+
+    def partial_fit(self, assigns):
+        """Adds the transitions in `assigns` to the running counts and
+        refits the transition probability matrix."""
+        new_counts = kernels.transition_counts(
+            assigns, self.max_n_states, lag_time=self.lag_time)
+        if self.counts is None:
+            self.counts = new_counts
+        else:
+            self.counts = self.counts + new_counts
+        return self._build()
+
+    def _build(self):
+        """Builds the transition probability matrix from the running
+        counts."""
+        # builders may modify the counts they are passed
+        self.tcounts_, self.tprobs_, self.eq_probs_ = self.method(
+            self.counts.copy())
+        # keep the wrapped MSM object in sync for callers inspecting it
+        self.msm_obj.tcounts_ = self.tcounts_
+        self.msm_obj.tprobs_ = self.tprobs_
+        self.msm_obj.eq_probs_ = self.eq_probs_
+        return self
 
 
 def adaptive_sampling(
         T, initial_state=0, n_runs=1, n_clones=1, n_steps=1,
         msm_obj=None, ranking_obj=None, n_reps=1, n_procs=1,
-        assignments=None):
+        assignments=None, skip_self=False, incremental=False, seed=None,
+        output=None, checkpoint_dir=None, checkpoint_interval=10,
+        executor=None, tmp_dir=None, shard=None, stop_condition=None):
     """Get synthetic adaptive sampling run from an MSM
 
     Parameters
     ----------
-    T : array, shape=(n_states, n_states)
+    T : array, sparse matrix, or TransitionSampler
         The transition probability matrix from which to sample.
     initial_state : int, default=0
         The initial state from which to start simulations.
@@ -46,43 +530,239 @@ def adaptive_sampling(
     ranking_obj : rankings object
         This is an object with at least two functions: __init__(**args)
         and select_states(msm, n_clones). The output of this object is
-        a list of states to simulate.
+        a list of states to simulate. If select_states also takes an
+        `rng` keyword, it is passed the generator of the run.
     n_reps : int, default=1
         The number of repetitions of adaptive sampling to perform.
     n_procs : int, default=1
-        The number of processes to use when doing adaptive sampling.
-        This parallelizes over the number of reps.
+        The number of processes (or threads, with executor='thread') to
+        use when doing adaptive sampling. This parallelizes over the
+        number of reps.
     assignments : array-like, shape = (n_trajs, n_steps), default=None
         Optionally provide assignments to continue sampling from.
+    skip_self : bool, default=False
+        Optionally skip over self-transitions by drawing the length of
+        each dwell from a geometric distribution. This produces the same
+        distribution of trajectories, but is much faster on landscapes
+        where most steps are self-transitions.
+    incremental : bool, default=False
+        Optionally keep a running count matrix and only count the
+        transitions of each new round, instead of refitting `msm_obj`
+        on all assignments every round. Requires an untrimmed MSM.
+    seed : int or numpy.random.SeedSequence, default=None
+        The master seed. Each rep draws its trajectories and breaks
+        ranking ties with its own generator spawned from `seed`, so the
+        output only depends on `seed`.
+    output : str, default=None
+        Optionally write the assignments of each rep to this .npy file
+        as soon as the rep finishes, instead of holding every rep in
+        memory. The returned array is memory-mapped from the file.
+    checkpoint_dir : str, default=None
+        Optionally checkpoint each rep to this directory every
+        `checkpoint_interval` rounds. Calling adaptive_sampling again
+        with the same arguments and directory skips the reps that
+        finished and resumes the others from their last checkpoint,
+        with the same result as an uninterrupted call. A directory
+        left by a call with a different number of rounds, clones or
+        steps, or a different seed, raises a ValueError.
+    checkpoint_interval : int, default=10
+        The number of rounds between checkpoints.
+    executor : str or executor object, default=None
+        How reps are run: 'serial', 'process', 'thread' or 'mpi', or an
+        executor object (see executors.get_executor). Reps are handed
+        out as workers become free. Defaults to a process pool of
+        `n_procs` processes.
+    tmp_dir : str, default=None
+        The directory in which the sampling tables are shared with the
+        workers. Defaults to the system temporary directory. When using
+        MPI across nodes, this must be on a shared filesystem.
+    shard : tuple, default=None
+        Optionally only run shard k of K, given as (k, K), i.e. for a
+        job array. Shard k runs the reps k, k+K, k+2K, ..., each with
+        the same seed it gets in an unsharded call, so `seed` is
+        required. With `output`, a JSON sidecar listing the reps of the
+        shard is written next to it, for use with merge_shards.
+    stop_condition : stop condition object, default=None
+        Optionally stop each rep after the round in which this condition
+        is met (see stop_conditions), i.e. on reaching an end state.
+        Rounds after the discovery are not simulated and are filled
+        with -1.
 
     Returns
     ----------
     assignments : array, shape=(n_reps, n_runs, n_clones, n_steps)
-       The assignments files for adaptive sampling runs.
+       The assignments files for adaptive sampling runs. With `shard`,
+       only the reps of the shard are returned, in increasing order.
+    discoveries : array, shape=(n_reps, 3)
+       Only returned with a stop condition. The (round, clone, frame)
+       at which each rep met the condition, or -1 if it never did. With
+       `output`, these are also written to <output>_discovery.npy.
     """
     if msm_obj is None:
         builder_obj = partial(builders.normalize, calculate_eq_probs=False)
         msm_obj = MSM(
-            lag_time=1, method=builder_obj, max_n_states=len(T))
-    if msm_obj.max_n_states != len(T):
+            lag_time=1, method=builder_obj, max_n_states=_n_states(T))
+    if msm_obj.max_n_states != _n_states(T):
         print(
             "MSM.max_n_states should be equal to the total number of" + \
             "states. Changing value.")
-        msm_obj.max_n_states = len(T)
+        msm_obj.max_n_states = _n_states(T)
     if ranking_obj is None:
         ranking_obj = rankings.counts()
-        
-    sampling_info = list(
-        zip(
-            itertools.repeat(
-                Adaptive_Sampling(
-                    T, initial_state, n_runs, n_clones, n_steps, msm_obj,
-                    ranking_obj, assignments),
-                n_reps)))
-    pool = Pool(processes = n_procs)
-    new_assignments = pool.map(_run_sampling, sampling_info)
-    pool.terminate()
-    return np.array(new_assignments)
+    rep_nums = range(n_reps)
+    if shard is not None:
+        shard_num, n_shards = shard
+        if not (0 <= shard_num < n_shards):
+            raise ValueError(
+                "shard must be (k, K) with 0 <= k < K. Got %s." % (shard,))
+        if seed is None:
+            raise ValueError(
+                "A seed is required for the shards to be consistent.")
+        rep_nums = range(shard_num, n_reps, n_shards)
+        if len(rep_nums) == 0:
+            raise ValueError(
+                "Shard %d of %d has no reps." % (shard_num, n_shards))
+    # position of each rep in the output
+    rep_iis = {rep_num: ii for ii, rep_num in enumerate(rep_nums)}
+
+    with _shared_sampler(T, skip_self=skip_self, tmp_dir=tmp_dir) as sampler:
+        template = Adaptive_Sampling(
+            sampler, initial_state, n_runs, n_clones, n_steps, msm_obj,
+            ranking_obj, assignments, skip_self=skip_self,
+            incremental=incremental, stop_condition=stop_condition)
+        finished_reps = set()
+        if checkpoint_dir is not None:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+            seed_parameters = None
+            if seed is not None:
+                seed_seq = seed
+                if not isinstance(seed_seq, np.random.SeedSequence):
+                    seed_seq = np.random.SeedSequence(seed_seq)
+                # the reps spawned from a seed sequence depend on how
+                # many children it already spawned
+                seed_parameters = [
+                    str(seed_seq.entropy), list(seed_seq.spawn_key),
+                    seed_seq.n_children_spawned]
+            _check_run_parameters(checkpoint_dir, {
+                'initial_state': np.asarray(initial_state).tolist(),
+                'n_runs': n_runs, 'n_clones': n_clones, 'n_steps': n_steps,
+                'skip_self': bool(skip_self),
+                'incremental': bool(incremental), 'seed': seed_parameters,
+                'starting_assignments': (
+                    None if assignments is None
+                    else list(np.shape(assignments)))})
+            finished_reps = set(
+                rep_num for rep_num in rep_nums
+                if os.path.exists(
+                    _checkpoint_names(checkpoint_dir, rep_num)[1]))
+        seed_seqs = _rep_seeds(seed, n_reps)
+        sampling_info = [
+            (template, rep_num, seed_seqs[rep_num], checkpoint_dir,
+                checkpoint_interval)
+            for rep_num in rep_nums if rep_num not in finished_reps]
+        new_assignments = None
+        discoveries = np.zeros((len(rep_nums), 3), dtype=int)
+        with executors.get_executor(executor, n_procs=n_procs) as pool:
+            finished = (
+                (rep_num,
+                    np.load(
+                        _checkpoint_names(checkpoint_dir, rep_num)[1],
+                        mmap_mode='r'),
+                    np.load(_discovery_name(
+                        _checkpoint_names(checkpoint_dir, rep_num)[1])))
+                for rep_num in sorted(finished_reps))
+            # reps are stored as they finish
+            for rep_num, rep_assignments, discovery in itertools.chain(
+                    finished,
+                    pool.imap_unordered(_run_sampling, sampling_info)):
+                if new_assignments is None:
+                    shape = (len(rep_nums),) + rep_assignments.shape
+                    if output is None:
+                        new_assignments = np.zeros(
+                            shape, dtype=rep_assignments.dtype)
+                    else:
+                        new_assignments = np.lib.format.open_memmap(
+                            output, mode='w+', dtype=rep_assignments.dtype,
+                            shape=shape)
+                new_assignments[rep_iis[rep_num]] = rep_assignments
+                discoveries[rep_iis[rep_num]] = discovery
+    if output is not None:
+        new_assignments.flush()
+        if stop_condition is not None:
+            np.save(_discovery_name(output), discoveries)
+        if shard is not None:
+            info = {
+                'shard': [int(shard_num), int(n_shards)],
+                'n_reps': int(n_reps), 'rep_nums': list(rep_nums)}
+            with open(_shard_info_name(output), 'w') as f:
+                json.dump(info, f)
+    if stop_condition is not None:
+        return new_assignments, discoveries
+    return new_assignments
+
+
+def _shard_info_name(output):
+    return os.path.splitext(output)[0] + '.json'
+
+
+def merge_shards(shard_outputs, output=None):
+    """Combines the outputs of sharded adaptive_sampling calls into one
+    array of every rep. Shards are memory-mapped and copied a rep at a
+    time, so only a single rep is held in memory.
+
+    Parameters
+    ----------
+    shard_outputs : list of str
+        The .npy files written by each shard. Their JSON sidecars must
+        be next to them.
+    output : str, default=None
+        Optionally write the merged assignments to this .npy file
+        instead of holding them in memory.
+
+    Returns
+    ----------
+    assignments : array, shape=(n_reps, n_runs, n_clones, n_steps)
+       The assignments of every rep.
+
+    Discoveries written by shards run with a stop condition are merged
+    into <output>_discovery.npy as well.
+    """
+    infos = []
+    for shard_output in shard_outputs:
+        with open(_shard_info_name(shard_output)) as f:
+            infos.append(json.load(f))
+    n_reps = infos[0]['n_reps']
+    if any(info['n_reps'] != n_reps for info in infos):
+        raise ValueError("Shards are from runs with different n_reps.")
+    rep_nums = np.concatenate([info['rep_nums'] for info in infos])
+    if not np.array_equal(np.sort(rep_nums), np.arange(n_reps)):
+        raise ValueError(
+            "Shards do not cover every rep exactly once. Missing reps: "
+            "%s" % np.setdiff1d(np.arange(n_reps), rep_nums))
+    assignments = None
+    for shard_output, info in zip(shard_outputs, infos):
+        shard_assignments = np.load(shard_output, mmap_mode='r')
+        if assignments is None:
+            shape = (n_reps,) + shard_assignments.shape[1:]
+            if output is None:
+                assignments = np.zeros(
+                    shape, dtype=shard_assignments.dtype)
+            else:
+                assignments = np.lib.format.open_memmap(
+                    output, mode='w+', dtype=shard_assignments.dtype,
+                    shape=shape)
+        for ii, rep_num in enumerate(info['rep_nums']):
+            assignments[rep_num] = shard_assignments[ii]
+    if output is not None:
+        assignments.flush()
+        shard_discoveries = [
+            _discovery_name(shard_output) for shard_output in shard_outputs]
+        if all(os.path.exists(name) for name in shard_discoveries):
+            discoveries = np.zeros((n_reps, 3), dtype=int)
+            for name, info in zip(shard_discoveries, infos):
+                discoveries[info['rep_nums']] = np.load(name)
+            np.save(_discovery_name(output), discoveries)
+    return assignments
 
 
 class Adaptive_Sampling:
@@ -90,7 +770,7 @@ class Adaptive_Sampling:
 
     Parameters
     ----------
-    T : array, shape=(n_states, n_states)
+    T : array, sparse matrix, or TransitionSampler
         The transition probability matrix from which to sample.
     initial_state : int, default=0
         The initial state from which to start simulations.
@@ -106,23 +786,44 @@ class Adaptive_Sampling:
     ranking_obj : rankings object
         This is an object with at least two functions: __init__(**args)
         and select_states(msm, n_clones). The output of this object is
-        a list of states to simulate.
+        a list of states to simulate. If select_states also takes an
+        `rng` keyword, it is passed the generator of the run.
     assignments : array-like, shape = (n_trajs, n_steps), default=None
         Optionally provide assignments to continue sampling from. If
         using previous assignments, number of steps for each trajectory
         must be the same.
+    skip_self : bool, default=False
+        Optionally skip over self-transitions by drawing the length of
+        each dwell from a geometric distribution.
+    incremental : bool, default=False
+        Optionally count only the transitions of each new round with an
+        incremental_msm, instead of refitting `msm_obj` from scratch.
+    stop_condition : stop condition object, default=None
+        Optionally stop the run after the round in which this condition
+        is met (see stop_conditions), i.e. on reaching an end state.
 
     Returns
     ----------
     assignments : array, shape=(n_runs, n_clones, n_steps)
-       The assignments files for adaptive sampling runs.
+       The assignments files for adaptive sampling runs. If the starting
+       assignments are not whole rounds of n_clones trajectories, the
+       trajectories are returned unsplit, with shape (n_trajs, n_steps).
     """
 
     def __init__(
             self, T, initial_state, n_runs, n_clones, n_steps, msm_obj,
-            ranking_obj, assignments=None):
+            ranking_obj, assignments=None, skip_self=False,
+            incremental=False, stop_condition=None):
         # Initialize class variables
-        self.T = T
+        # sampling tables are built once and reused for every clone
+        # and every round
+        if isinstance(T, TransitionSampler):
+            self.sampler = T
+        else:
+            self.sampler = TransitionSampler(T)
+        self.skip_self = skip_self
+        if self.skip_self:
+            self.sampler.exit_tables()
         self.initial_state = initial_state
         self.n_runs = n_runs
         self.n_clones = n_clones
@@ -131,6 +832,8 @@ class Adaptive_Sampling:
         self.n_steps = n_steps + 1
         self.msm_obj = msm_obj
         self.ranking_obj = ranking_obj
+        self.incremental = incremental
+        self.stop_condition = stop_condition
         # format initial assignments if present
         if assignments is not None:
             if len(assignments.shape) == 2:
@@ -143,40 +846,165 @@ class Adaptive_Sampling:
                 raise
         self.starting_assignments = assignments
 
-    def run(self):
-        # initialize random seed. This is necessary for getting
-        # independent samplings through parallelization.
-        rng = np.random.default_rng()
-        # initialize first run
-        assignments = []
-        if self.starting_assignments is None:
-            initial_assignments = np.array(
-                [synth_traj(self.T, self.n_steps, self.initial_state, rng=rng)
-                    for i in range(self.n_clones)])
-            assignments.append(initial_assignments)
-            # If there are no starting assignments, gets initial
-            # assignments from initial state and this counts as a single
-            # run of adaptive sampling.
-            run_start = 1
+    def run(self, rng=None, checkpoint=None, checkpoint_interval=10):
+        """Runs adaptive sampling. Trajectories and ranking ties are
+        drawn from `rng`, or from a freshly seeded generator if it is
+        None.
+
+        With `checkpoint`, the state of the run (the assignments so
+        far, the running counts, the ranking object and the state of
+        `rng`) is pickled to that file every `checkpoint_interval`
+        rounds and after the last round. If the file already exists, the
+        run resumes from it and gives the same assignments as an
+        uninterrupted run.
+
+        With a stop condition, the run ends after the round in which the
+        condition is met. The remaining rounds are filled with -1, and
+        the (round, clone, frame) of the discovery is stored in
+        `discovery_` (all -1 if the condition is never met)."""
+        if rng is None:
+            rng = np.random.default_rng()
+        ranking_obj = self.ranking_obj
+        if self.incremental:
+            msm = incremental_msm(self.msm_obj)
+        else:
+            msm = self.msm_obj
+        state_dtype = precision.get_state_dtype(self.sampler.n_states)
+        discovery = None
+        if (checkpoint is not None) and os.path.exists(checkpoint):
+            with open(checkpoint, 'rb') as f:
+                state = pickle.load(f)
+            n_start = state['n_start']
+            n_trajs = n_start + self.n_runs * self.n_clones
+            if state['n_trajs'] != n_trajs:
+                raise ValueError(
+                    "Checkpoint %s is from a run with a different number "
+                    "of trajectories." % checkpoint)
+            n_filled = len(state['assignments'])
+            assignments = np.full(
+                (n_trajs, self.n_steps), -1, dtype=state_dtype)
+            assignments[:n_filled] = state['assignments']
+            run_start = state['run_num']
+            n_counted = state['n_counted']
+            # only the counts are checkpointed, so the fit is rebuilt
+            # before ranking. Without incremental counting, the MSM is
+            # refit from every trajectory.
+            if not self.incremental:
+                n_counted = 0
+            elif state['counts'] is not None:
+                msm.counts = state['counts']
+                msm._build()
+            ranking_obj = state['ranking_obj']
+            rng.bit_generator.state = state['rng_state']
+            discovery = state.get('discovery')
         else:
-            # checks if previous assignments have multiple runs (purely
-            # for the formatting of output)
-            if len(self.starting_assignments.shape) == 3:
-                for assignment in self.starting_assignments:
-                    assignments.append(assignment)
+            # all trajectories are written into one flat buffer of shape
+            # (n_trajs, n_steps), filled a round at a time. The MSM is
+            # fit on views of the rows filled so far, so nothing is
+            # copied. Rows that are never filled stay -1.
+            starting_assignments = self.starting_assignments
+            if starting_assignments is None:
+                n_start = 0
             else:
-                assignments.append(self.starting_assignments)
-            run_start = 0
+                starting_assignments = np.asarray(starting_assignments)
+                starting_assignments = starting_assignments.reshape(
+                    (-1, starting_assignments.shape[-1]))
+                if starting_assignments.shape[1] != self.n_steps:
+                    raise ValueError(
+                        "Starting assignments have %d frames per "
+                        "trajectory, but n_steps gives %d." % (
+                            starting_assignments.shape[1], self.n_steps))
+                n_start = len(starting_assignments)
+            n_trajs = n_start + self.n_runs * self.n_clones
+            assignments = np.full(
+                (n_trajs, self.n_steps), -1, dtype=state_dtype)
+            # number of trajectories already in the running counts
+            n_counted = 0
+            # initialize first run
+            if starting_assignments is None:
+                synth_trajs(
+                    self.sampler, self.n_steps,
+                    np.repeat(self.initial_state, self.n_clones), rng=rng,
+                    skip_self=self.skip_self, out=assignments[:self.n_clones])
+                n_filled = self.n_clones
+                # If there are no starting assignments, gets initial
+                # assignments from initial state and this counts as a
+                # single run of adaptive sampling.
+                run_start = 1
+            else:
+                assignments[:n_start] = starting_assignments
+                n_filled = n_start
+                run_start = 0
+            if self.stop_condition is not None:
+                discovery, n_counted = self._check_stop(
+                    assignments, 0, n_filled, n_counted, msm)
         # iterate through each run and append assignments
         for run_num in range(run_start, self.n_runs):
+            if discovery is not None:
+                break
             # fit assignments with msm object
-            self.msm_obj.fit(np.concatenate(assignments))
+            if n_counted < n_filled:
+                n_counted = self._fit(msm, assignments, n_counted, n_filled)
             # rank states based on ranking object
-            states_to_simulate = self.ranking_obj.select_states(
-                self.msm_obj, self.n_clones)
-            new_assignments = np.array(
-                [synth_traj(self.T, self.n_steps, states_to_simulate[i], rng=rng)
-                    for i in range(self.n_clones)])
-            assignments.append(new_assignments)
-        assignments = np.array(assignments)
+            states_to_simulate = _select_states(
+                ranking_obj, msm, self.n_clones, rng)
+            synth_trajs(
+                self.sampler, self.n_steps, states_to_simulate[:self.n_clones],
+                rng=rng, skip_self=self.skip_self,
+                out=assignments[n_filled:n_filled + self.n_clones])
+            n_filled += self.n_clones
+            if self.stop_condition is not None:
+                discovery, n_counted = self._check_stop(
+                    assignments, n_filled - self.n_clones, n_filled,
+                    n_counted, msm)
+            if (checkpoint is not None) and (
+                    ((run_num + 1) % checkpoint_interval == 0) or
+                    (run_num + 1 == self.n_runs) or (discovery is not None)):
+                state = {
+                    'n_start': n_start, 'n_trajs': n_trajs,
+                    'assignments': assignments[:n_filled],
+                    'run_num': run_num + 1, 'n_counted': n_counted,
+                    'counts': getattr(msm, 'counts', None),
+                    'ranking_obj': ranking_obj,
+                    'rng_state': rng.bit_generator.state,
+                    'discovery': discovery}
+                _atomic_write(
+                    checkpoint, lambda f: pickle.dump(state, f))
+        if discovery is None:
+            discovery = (-1, -1, -1)
+        self.discovery_ = np.array(discovery)
+        # split into rounds (a reshape, not a copy) when the starting
+        # assignments are whole rounds
+        if n_start % self.n_clones == 0:
+            assignments = assignments.reshape(
+                (-1, self.n_clones, self.n_steps))
         return assignments
+
+    def _fit(self, msm, assignments, n_counted, n_filled):
+        """Fits the MSM to the first `n_filled` trajectories, of which
+        the first `n_counted` have already been counted. Returns the new
+        number of counted trajectories."""
+        if self.incremental:
+            msm.partial_fit(assignments[n_counted:n_filled])
+        else:
+            msm.fit(assignments[:n_filled])
+        return n_filled
+
+    def _check_stop(self, assignments, start, stop, n_counted, msm):
+        """Checks the stop condition on the trajectories start:stop.
+        Returns the (round, clone, frame) of the discovery, or None, and
+        the new number of counted trajectories."""
+        if self.stop_condition.needs_msm:
+            n_counted = self._fit(msm, assignments, n_counted, stop)
+        hit = self.stop_condition.check(assignments[start:stop], msm)
+        if hit is None:
+            return None, n_counted
+        traj_num, frame = hit
+        if traj_num < 0:
+            # conditions on the whole MSM are tied to the last round
+            traj_num = stop - 1 - start
+            clone = -1
+        else:
+            clone = (start + traj_num) % self.n_clones
+        discovery = ((start + traj_num) // self.n_clones, clone, frame)
+        return tuple(int(d) for d in discovery), n_counted
@@ -0,0 +1,88 @@
+import numpy as np
+
+# package-wide defaults. Everything is float64 and platform ints unless
+# changed with set_precision or precision_policy.
+_float_dtype = np.dtype(np.float64)
+_compact_states = False
+
+FLOAT_DTYPES = [np.dtype(np.float32), np.dtype(np.float64)]
+STATE_DTYPES = [
+    np.dtype(np.int8), np.dtype(np.int16), np.dtype(np.int32),
+    np.dtype(np.int64)]
+
+
+def set_precision(float_dtype=None, compact_states=None):
+    """Sets the package-wide precision policy.
+
+    Parameters
+    ----------
+    float_dtype : dtype, default=None
+        The floating point type of landscapes, transition probability
+        matrices, and sampling tables. Either float32 or float64.
+    compact_states : bool, default=None
+        Whether state indices (i.e. trajectories and assignments) use the
+        smallest signed integer type that fits the number of states.
+        Signed types are used so that -1 can mark missing frames.
+    """
+    global _float_dtype, _compact_states
+    if float_dtype is not None:
+        float_dtype = np.dtype(float_dtype)
+        if float_dtype not in FLOAT_DTYPES:
+            raise ValueError(
+                "float_dtype must be float32 or float64. Got '%s'." %
+                float_dtype)
+        _float_dtype = float_dtype
+    if compact_states is not None:
+        _compact_states = bool(compact_states)
+
+
+def get_precision():
+    """Returns the current (float_dtype, compact_states) policy."""
+    return _float_dtype, _compact_states
+
+
+def get_float_dtype(dtype=None):
+    """Returns `dtype`, or the policy's float type if it is None."""
+    if dtype is None:
+        return _float_dtype
+    return np.dtype(dtype)
+
+
+def get_state_dtype(n_states, compact=None):
+    """Returns the integer type used for indices of `n_states` states.
+    If `compact` (or the policy's compact_states if None), this is the
+    smallest signed integer type that fits, otherwise it is the
+    platform int."""
+    if compact is None:
+        compact = _compact_states
+    if not compact:
+        return np.dtype(int)
+    for dtype in STATE_DTYPES:
+        if n_states - 1 <= np.iinfo(dtype).max:
+            return dtype
+    raise ValueError("Too many states for an integer index: %d" % n_states)
+
+
+class precision_policy:
+    """Context manager that temporarily sets the precision policy.
+
+    Examples
+    --------
+    >>> with precision_policy(float_dtype=np.float32, compact_states=True):
+    ...     T = l.to_probs(sparse=True)
+    """
+
+    def __init__(self, float_dtype=None, compact_states=None):
+        self.float_dtype = float_dtype
+        self.compact_states = compact_states
+
+    def __enter__(self):
+        self._previous = get_precision()
+        set_precision(
+            float_dtype=self.float_dtype, compact_states=self.compact_states)
+        return self
+
+    def __exit__(self, *args):
+        set_precision(
+            float_dtype=self._previous[0],
+            compact_states=self._previous[1])
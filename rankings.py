@@ -44,27 +44,34 @@ class DistanceLookup:
         dist_pairs = self.dists[frame, :][centers]
         return self.metric(dist_pairs)
 
-def _evens_select_states(unique_states, n_clones):
+def _evens_select_states(unique_states, n_clones, rng=None):
     """Helper function for evens state selection. Picks among all
     discovered states evenly. If more states were discovered than
-    clones, randomly picks remainder states."""
+    clones, randomly picks remainder states. Random picks are drawn
+    from `rng`, or from the global numpy random state if it is None."""
+    if rng is None:
+        rng = np.random
     # calculate the number of clones per state and the balance to
     # match n_clones
     clones_per_state = int(n_clones / len(unique_states))
     remainder_states = n_clones % len(unique_states)
     # generate states to simulate list
     repeat_states_to_simulate = np.repeat(unique_states, clones_per_state)
-    remainder_states_to_simulate = np.random.choice(
+    remainder_states_to_simulate = rng.choice(
         unique_states, remainder_states, replace=False)
     total_states_to_simulate = np.concatenate(
         [repeat_states_to_simulate, remainder_states_to_simulate])
     return total_states_to_simulate
 
 
-def _unbias_state_selection(states, rankings, n_selections, select_max=True):
+def _unbias_state_selection(
+        states, rankings, n_selections, select_max=True, rng=None):
     """Unbiases state selection due to state labeling. Shuffles states
     with equivalent rankings so that state index does not influence
-    selection probability."""
+    selection probability. Shuffles are drawn from `rng`, or from the
+    global numpy random state if it is None."""
+    if rng is None:
+        rng = np.random
     # determine the unique ranking values
     unique_rankings = np.unique(rankings)
     # sort states and rankings
@@ -81,7 +88,7 @@ def _unbias_state_selection(states, rankings, n_selections, select_max=True):
     tot_state_count = 0
     for ranking_num in unique_rankings:
         iis = np.where(sorted_rankings == ranking_num)[0]
-        sorted_states[iis] = sorted_states[np.random.permutation(iis)]
+        sorted_states[iis] = sorted_states[rng.permutation(iis)]
         tot_state_count += len(iis)
         if tot_state_count > n_selections:
             break
@@ -90,10 +97,10 @@ def _unbias_state_selection(states, rankings, n_selections, select_max=True):
 
 def _select_states_spreading(
         rankings, unique_states, n_clones, centers, distance_metric,
-        select_max=True, width=1.0, non_overlap=True):
+        select_max=True, width=1.0, non_overlap=True, rng=None):
     states_to_simulate = [
         _unbias_state_selection(
-            unique_states, rankings, 1, select_max=select_max)[0]]
+            unique_states, rankings, 1, select_max=select_max, rng=rng)[0]]
     dist_list = []
     for num in range(n_clones-1):
         dist_list.append(
@@ -115,7 +122,8 @@ def _select_states_spreading(
                 new_rankings[states_to_zero] = np.inf
         states_to_simulate.append(
             _unbias_state_selection(
-                unique_states, new_rankings, 1, select_max=select_max)[0])
+                unique_states, new_rankings, 1, select_max=select_max,
+                rng=rng)[0])
     states_to_simulate = np.array(states_to_simulate)
     return states_to_simulate
                 
@@ -248,9 +256,9 @@ class evens:
         return np.zeros(len(unique_states))
         
 
-    def select_states(self, msm, n_clones):
+    def select_states(self, msm, n_clones, rng=None):
         unique_states = get_unique_states(msm)
-        return _evens_select_states(unique_states, n_clones)
+        return _evens_select_states(unique_states, n_clones, rng=rng)
 
 
 class base_ranking:
@@ -265,13 +273,14 @@ class base_ranking:
         self.distance_metric = distance_metric
         self.width = width
 
-    def select_states(self, msm, n_clones):
+    def select_states(self, msm, n_clones, rng=None):
         # determine discovered states from msm
         unique_states = get_unique_states(msm)
         # if not enough discovered states for selection of n_clones,
         # selects states using the evens method
         if len(unique_states) < n_clones:
-            states_to_simulate = _evens_select_states(unique_states, n_clones)
+            states_to_simulate = _evens_select_states(
+                unique_states, n_clones, rng=rng)
         # selects the n_clones with minimum counts
         else:
             rankings = self.rank(msm, unique_states=unique_states)
@@ -280,13 +289,13 @@ class base_ranking:
             # if not enought non-`nan` states are discivered, performs evens
             if len(non_nan_rank_iis) < n_clones:
                 states_to_simulate = _evens_select_states(
-                    unique_states[non_nan_rank_iis], n_clones)
+                    unique_states[non_nan_rank_iis], n_clones, rng=rng)
             else:
                 if (self.state_centers is None) or (self.distance_metric is None):
                     states_to_simulate = _unbias_state_selection(
                         unique_states[non_nan_rank_iis],
                         rankings[non_nan_rank_iis], n_clones,
-                        select_max=self.maximize_ranking)
+                        select_max=self.maximize_ranking, rng=rng)
                 else:
                     states_to_simulate = _select_states_spreading(
                         rankings[non_nan_rank_iis],
@@ -294,7 +303,7 @@ class base_ranking:
                         centers=self.state_centers,
                         distance_metric=self.distance_metric,
                         select_max=self.maximize_ranking,
-                        width=self.width)
+                        width=self.width, rng=rng)
         return states_to_simulate
 
 
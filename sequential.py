@@ -0,0 +1,122 @@
+import numpy as np
+import warnings
+from scipy import stats
+from . import stop_conditions
+from .mc_sampling import _shared_sampler, adaptive_sampling
+
+
+def _wilson_interval(n_hits, n_reps, z):
+    """The Wilson score interval of a binomial proportion."""
+    p = n_hits / n_reps
+    denominator = 1 + z**2 / n_reps
+    center = (p + z**2 / (2*n_reps)) / denominator
+    half_width = z * np.sqrt(
+        p*(1-p) / n_reps + z**2 / (4*n_reps**2)) / denominator
+    return p, (
+        max(center - half_width, 0.), min(center + half_width, 1.))
+
+
+def _normal_interval(values, z):
+    """The normal-approximation interval of a mean. Needs at least two
+    values."""
+    if len(values) < 2:
+        return np.nan, (np.nan, np.nan)
+    mean = np.mean(values)
+    half_width = z * np.std(values, ddof=1) / np.sqrt(len(values))
+    return mean, (mean - half_width, mean + half_width)
+
+
+def _estimate(discoveries, estimate, z):
+    discovered = discoveries[:, 0] >= 0
+    if estimate == 'probability':
+        return _wilson_interval(discovered.sum(), len(discoveries), z)
+    return _normal_interval(discoveries[discovered, 0], z)
+
+
+def sequential_adaptive_sampling(
+        T, end_state, estimate='probability', ci_width=0.05,
+        confidence=0.95, batch_size=100, max_reps=10000, seed=None,
+        **sampling_kwargs):
+    """Runs adaptive sampling reps in batches until the estimate of how
+    readily `end_state` is discovered is known to a requested precision.
+    Each rep stops as soon as it discovers `end_state`. After every
+    batch, the confidence interval of the estimate is updated, and no
+    more batches are run once it is narrower than `ci_width`.
+
+    Parameters
+    ----------
+    T : array, sparse matrix, or TransitionSampler
+        The transition probability matrix from which to sample.
+    end_state : int or array-like
+        The state (or any of the states) to discover.
+    estimate : str, default='probability'
+        'probability' estimates the probability that a rep discovers
+        `end_state` within n_runs rounds, with a Wilson score interval.
+        'time' estimates the mean round of discovery (0 is the initial
+        round) of the reps that discover it, with a normal interval.
+    ci_width : float, default=0.05
+        The target width of the confidence interval.
+    confidence : float, default=0.95
+        The confidence level of the interval.
+    batch_size : int, default=100
+        The number of reps per batch.
+    max_reps : int, default=10000
+        The maximum number of reps. A warning is given if the target
+        width is not reached by then.
+    seed : int or numpy.random.SeedSequence, default=None
+        The master seed. Each batch gets its own seed spawned from it.
+    **sampling_kwargs
+        Keyword arguments passed on to adaptive_sampling for every
+        batch, i.e. n_runs, n_clones, n_steps, ranking_obj and n_procs.
+
+    Returns
+    ----------
+    value : float
+        The estimated probability or mean discovery round.
+    interval : tuple
+        The (lower, upper) bounds of the confidence interval.
+    discoveries : array, shape=(n_reps, 3)
+        The (round, clone, frame) at which each rep discovered
+        `end_state`, or -1 if it did not.
+    """
+    if estimate not in ['probability', 'time']:
+        raise ValueError(
+            "estimate must be 'probability' or 'time'. Got '%s'." %
+            estimate)
+    if max_reps < 1:
+        raise ValueError("max_reps must be at least 1.")
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    z = stats.norm.ppf(0.5 + confidence/2.)
+    stop_condition = stop_conditions.target_states(end_state)
+    discoveries = np.zeros((0, 3), dtype=int)
+    width = np.nan
+    # the sampling tables are built and shared once for every batch
+    shared_sampler = _shared_sampler(
+        T, skip_self=sampling_kwargs.get('skip_self', False),
+        tmp_dir=sampling_kwargs.get('tmp_dir'))
+    with shared_sampler as sampler:
+        while len(discoveries) < max_reps:
+            n_reps = min(batch_size, max_reps - len(discoveries))
+            batch_seed, = seed.spawn(1)
+            _, batch_discoveries = adaptive_sampling(
+                sampler, n_reps=n_reps, seed=batch_seed,
+                stop_condition=stop_condition, **sampling_kwargs)
+            discoveries = np.concatenate([discoveries, batch_discoveries])
+            value, interval = _estimate(discoveries, estimate, z)
+            width = interval[1] - interval[0]
+            if width <= ci_width:
+                break
+        else:
+            if np.isnan(width):
+                advice = "Too few reps discovered the end state to estimate "
+                advice += "the interval."
+            else:
+                # the width shrinks with the square root of the reps
+                advice = "Roughly %d reps are needed." % np.ceil(
+                    len(discoveries) * (width / ci_width)**2)
+            warnings.warn(
+                "The confidence interval is %.3g wide after max_reps=%d "
+                "reps, wider than the target of %.3g. %s" % (
+                    width, max_reps, ci_width, advice))
+    return value, interval, discoveries
@@ -6,12 +6,12 @@ def funneled_landscape(grid_size, width_frac=0.707, depth=1, resolution=1):
     l = landscape(grid_size=grid_size, resolution=resolution)
     x0 = np.array([grid_size[0], grid_size[1]])
     widths = x0*width_frac
-    l = l.add_gaussian(x0, height=-depth, widths=widths)
+    l.add_gaussian(x0, height=-depth, widths=widths, inplace=True)
     return l
 
 
 def diagonal_barrier(
-        grid_size, position=0.5, height=1, width=1, resolution=1):
+        grid_size, position=0.5, height=1, width=1, resolution=1, cutoff=6):
     l = landscape(grid_size=grid_size, resolution=resolution)
     semi_circum = len(l.x1_coords)+len(l.x1_coords[0]) - 1
     diag = int(semi_circum * position) - len(l.x1_coords)
@@ -20,17 +20,17 @@ def diagonal_barrier(
             zip(
                 l.x1_coords[::-1].diagonal(diag),
                 l.x2_coords[::-1].diagonal(diag))))
-    for center in centers:
-        l = l.add_gaussian(x0s=center, height=height, widths=width)
+    l.add_gaussians(
+        centers, heights=height, widths=width, cutoff=cutoff, inplace=True)
     return l
 
 
 def egg_carton_landscape(
         grid_size, gaussians_per_axis, height=1, width=1, resolution=1):
     l = landscape(grid_size=grid_size, resolution=resolution)
-    l = l.add_noise(
+    l.add_noise(
         gaussians_per_axis=gaussians_per_axis, height_range=[height, height],
-        width_range=[width, width], rigidity=100000)
+        width_range=[width, width], rigidity=100000, inplace=True)
     return l
 
 
@@ -46,7 +46,7 @@ def single_barrier(grid_x=40,grid_y=20,barrier_height=3,add_noise=False):
     x_col = int(grid_x / 2)
     l.values[:,x_col] = barrier_height
     if add_noise:
-        l = l.add_noise(gaussians_per_axis=10, height_range=[-(barrier_height/2),(barrier_height/2)])
+        l.add_noise(gaussians_per_axis=10, height_range=[-(barrier_height/2),(barrier_height/2)], inplace=True)
     return l
 
 def multiple_paths(grid_x=40,path_width=5,barrier_height=3,add_noise=False,number_paths=3):
@@ -58,7 +58,7 @@ def multiple_paths(grid_x=40,path_width=5,barrier_height=3,add_noise=False,numbe
         barrier_list.append((path_width*i) + (i-1))
     l.values[barrier_list,x_col:] = barrier_height
     if add_noise:
-        l = l.add_noise(height_range=[-(barrier_height*(1/2)),(barrier_height*(1/2))])
+        l.add_noise(height_range=[-(barrier_height*(1/2)),(barrier_height*(1/2))], inplace=True)
     return l
 
 def multiple_barriers(well_width=100,well_depth=50,barrier_height=3,add_noise=False,number_barriers=3):
@@ -78,5 +78,5 @@ def multiple_barriers(well_width=100,well_depth=50,barrier_height=3,add_noise=Fa
             l.values[0:well_width,((i-1)*well_depth + well_depth -1)] =  barrier_height
         j = j+1
     if add_noise:
-        l = l.add_noise(height_range=[-(barrier_height*(1/2)),(barrier_height*(1/2))])
+        l.add_noise(height_range=[-(barrier_height*(1/2)),(barrier_height*(1/2))], inplace=True)
     return l
@@ -0,0 +1,56 @@
+import numpy as np
+
+
+class target_states:
+    """Stops a sampling run as soon as any of `states` is visited.
+
+    Parameters
+    ----------
+    states : int or array-like, shape=(n_states, )
+        The target states, i.e. the end state of a landscape.
+    """
+
+    # only the new trajectories are needed to check for a hit
+    needs_msm = False
+
+    def __init__(self, states):
+        self.states = np.array(states).reshape((-1,))
+
+    def check(self, trajs, msm=None):
+        """Returns the (trajectory, frame) of the earliest visit to a
+        target state in `trajs`, or None if there is no visit. Ties in
+        the frame go to the first trajectory."""
+        hits = np.isin(trajs, self.states)
+        hit_trajs = np.where(hits.any(axis=1))[0]
+        if len(hit_trajs) == 0:
+            return None
+        first_frames = np.argmax(hits[hit_trajs], axis=1)
+        earliest = np.argmin(first_frames)
+        return hit_trajs[earliest], first_frames[earliest]
+
+
+class counts_predicate:
+    """Stops a sampling run once a function of the MSM fit to all of the
+    trajectories so far returns True, i.e.
+    `counts_predicate(lambda msm: msm.tcounts_[5].sum() > 100)`. The
+    function must be picklable to be used with several processes.
+
+    Parameters
+    ----------
+    predicate : callable
+        Takes the fit MSM (with `tcounts_`, `tprobs_` and `eq_probs_`)
+        and returns whether to stop.
+    """
+
+    # the MSM is refit after every round to check the predicate
+    needs_msm = True
+
+    def __init__(self, predicate):
+        self.predicate = predicate
+
+    def check(self, trajs, msm=None):
+        """Returns (-1, -1) if the predicate is met, since it is not
+        tied to a single trajectory and frame, or None otherwise."""
+        if self.predicate(msm):
+            return -1, -1
+        return None
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from slandscapes import rankings, special_landscapes
+from slandscapes.batched import (
+    _batched_select_states, batched_adaptive_sampling)
+from slandscapes.mc_analysis import discover_probabilities
+from slandscapes.mc_sampling import adaptive_sampling
+
+N_REPS = 400
+
+
+def _ranking_objs(n_states):
+    return {
+        'counts': rankings.counts(),
+        'evens': rankings.evens(),
+        'FAST': rankings.FAST(
+            state_rankings=np.arange(n_states, dtype=float))}
+
+
+@pytest.mark.parametrize('name', ['counts', 'evens', 'FAST'])
+def test_matches_adaptive_sampling(name):
+    T = special_landscapes.funneled_landscape((5, 5)).to_probs(sparse=True)
+    n_states = T.shape[0]
+    kwargs = dict(
+        initial_state=0, n_runs=4, n_clones=3, n_steps=4,
+        ranking_obj=_ranking_objs(n_states)[name], n_reps=N_REPS, seed=0)
+    assignments = adaptive_sampling(T, executor='serial', **kwargs)
+    batched_assignments = batched_adaptive_sampling(T, **kwargs)
+    assert batched_assignments.shape == assignments.shape
+    # the probability of discovering each state agrees within error
+    probs = discover_probabilities(
+        assignments.reshape((N_REPS, -1)), n_states=n_states)
+    batched_probs = discover_probabilities(
+        batched_assignments.reshape((N_REPS, -1)), n_states=n_states)
+    errors = np.sqrt(
+        (probs*(1-probs) + batched_probs*(1-batched_probs)) / N_REPS)
+    assert np.all(np.abs(probs - batched_probs) <= 4*errors + 0.01)
+    # and so does the mean number of discovered states
+    n_discovered = probs.sum()
+    batched_n_discovered = batched_probs.sum()
+    n_discovered_error = np.std(
+        [len(np.unique(ass)) for ass in assignments.reshape((N_REPS, -1))])
+    assert abs(n_discovered - batched_n_discovered) <= \
+        4 * n_discovered_error * np.sqrt(2 / N_REPS)
+
+
+@pytest.mark.parametrize('name', ['counts', 'FAST'])
+def test_evens_fallback(name):
+    # the first rep has discovered two states, fewer than the clones,
+    # and the second rep has discovered five
+    state_counts = np.array([
+        [3, 0, 1, 0, 0, 0],
+        [1, 1, 1, 1, 2, 0]])
+    ranking_obj = _ranking_objs(6)[name]
+    rng = np.random.default_rng(0)
+    for trial in range(20):
+        states = _batched_select_states(ranking_obj, state_counts, 5, rng)
+        # the states are picked evenly, 5 // 2 or 5 // 2 + 1 times each
+        picks = np.bincount(states[0], minlength=6)
+        assert set(np.where(picks)[0]) == {0, 2}
+        assert sorted(picks[[0, 2]]) == [2, 3]
+        # the second rep picks every discovered state once
+        assert sorted(states[1]) == [0, 1, 2, 3, 4]
+
+
+def test_reproducible():
+    T = special_landscapes.funneled_landscape((5, 5)).to_probs(sparse=True)
+    kwargs = dict(n_runs=3, n_clones=3, n_steps=4, n_reps=10)
+    for ranking_obj in _ranking_objs(T.shape[0]).values():
+        assignments = batched_adaptive_sampling(
+            T, ranking_obj=ranking_obj, seed=0, **kwargs)
+        assert np.all(
+            batched_adaptive_sampling(
+                T, ranking_obj=ranking_obj, seed=0, **kwargs) ==
+            assignments)
+        assert np.any(
+            batched_adaptive_sampling(
+                T, ranking_obj=ranking_obj, seed=1, **kwargs) !=
+            assignments)
@@ -0,0 +1,24 @@
+import numpy as np
+from slandscapes import caching, special_landscapes
+from slandscapes.mc_sampling import adaptive_sampling
+
+
+def test_cached_sparse_probs_in_adaptive_sampling(tmp_path):
+    l = special_landscapes.funneled_landscape((6, 6))
+    cache = caching.probs_cache(cache_dir=str(tmp_path))
+    T = l.to_probs(sparse=True, cache=cache)
+    assert not T.data.flags.writeable
+    data = np.array(T.data)
+    assignments = adaptive_sampling(
+        T, n_runs=3, n_clones=2, n_steps=5, n_reps=2, seed=0,
+        executor='serial')
+    assert assignments.shape == (2, 3, 2, 6)
+    # the cached matrix is untouched, and disk hits give the same result
+    assert np.all(T.data == data)
+    # a fresh cache on the same directory memory-maps the entry
+    T_hit = l.to_probs(
+        sparse=True, cache=caching.probs_cache(cache_dir=str(tmp_path)))
+    assert np.all(
+        adaptive_sampling(
+            T_hit, n_runs=3, n_clones=2, n_steps=5, n_reps=2, seed=0,
+            executor='serial') == assignments)
@@ -0,0 +1,27 @@
+import numpy as np
+from slandscapes import rankings
+from slandscapes.comparisons import compare_rankings
+from slandscapes.mc_sampling import TransitionSampler
+
+T = np.array([
+    [0.8, 0.2, 0.0, 0.0],
+    [0.2, 0.6, 0.2, 0.0],
+    [0.0, 0.2, 0.6, 0.2],
+    [0.0, 0.0, 0.2, 0.8]])
+
+
+def test_compare_rankings_with_sampler():
+    ranking_objs = {'counts': rankings.counts(), 'evens': rankings.evens()}
+    kwargs = dict(
+        n_runs=3, n_clones=2, n_steps=3, n_reps=4, seed=0,
+        executor='serial', return_assignments=True)
+    comparison = compare_rankings(T, ranking_objs, **kwargs)
+    sampler_comparison = compare_rankings(
+        TransitionSampler(T), ranking_objs, **kwargs)
+    assert comparison.names == ['counts', 'evens']
+    assert np.all(comparison.metrics == sampler_comparison.metrics)
+    assert np.all(
+        comparison.assignments == sampler_comparison.assignments)
+    # every ranking object shares the initial round of a rep
+    assert np.all(
+        comparison.assignments[0, :, 0] == comparison.assignments[1, :, 0])
@@ -0,0 +1,56 @@
+import concurrent.futures
+import numpy as np
+import pytest
+import sys
+import types
+from slandscapes import executors
+from slandscapes.mc_sampling import adaptive_sampling
+
+T = np.array([
+    [0.5, 0.5, 0.0],
+    [0.25, 0.5, 0.25],
+    [0.0, 0.5, 0.5]])
+KWARGS = dict(n_runs=4, n_clones=2, n_steps=5, n_reps=3, seed=0)
+
+
+def test_futures_executor_is_abstract():
+    with pytest.raises(TypeError):
+        executors._futures_executor()
+
+
+def test_executors_agree():
+    assignments = adaptive_sampling(T, executor='serial', **KWARGS)
+    for executor in ['process', 'thread']:
+        assert np.all(
+            adaptive_sampling(
+                T, executor=executor, n_procs=2, **KWARGS) == assignments)
+
+
+def test_mpi_executor(monkeypatch):
+    # stands in for mpi4py.futures, running tasks on threads
+    pools = []
+
+    class MPIPoolExecutor(concurrent.futures.ThreadPoolExecutor):
+        def __init__(self, max_workers=None):
+            super().__init__(max_workers=max_workers)
+            pools.append(max_workers)
+
+    mpi4py = types.ModuleType('mpi4py')
+    mpi4py.futures = types.ModuleType('mpi4py.futures')
+    mpi4py.futures.MPIPoolExecutor = MPIPoolExecutor
+    monkeypatch.setitem(sys.modules, 'mpi4py', mpi4py)
+    monkeypatch.setitem(sys.modules, 'mpi4py.futures', mpi4py.futures)
+    assignments = adaptive_sampling(T, executor='serial', **KWARGS)
+    assert np.all(
+        adaptive_sampling(
+            T, executor=executors.mpi_executor(max_workers=2),
+            **KWARGS) == assignments)
+    assert pools == [2]
+
+
+def test_mpi_executor_without_mpi4py(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'mpi4py', None)
+    monkeypatch.setitem(sys.modules, 'mpi4py.futures', None)
+    with pytest.raises(ImportError):
+        with executors.get_executor('mpi'):
+            pass
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+import scipy.sparse as spar
+from slandscapes import kernels
+from slandscapes.mc_sampling import TransitionSampler
+
+numba = pytest.importorskip('numba')
+
+
+def _random_T(n_states=20, seed=0):
+    rng = np.random.default_rng(seed)
+    T = rng.random((n_states, n_states))
+    T[T < 0.7] = 0
+    T[np.arange(n_states), np.arange(n_states)] += 0.5
+    return spar.csr_matrix(T / T.sum(axis=1)[:, None])
+
+
+def test_trajs_match_between_backends():
+    sampler = TransitionSampler(_random_T())
+    rng = np.random.default_rng(42)
+    start_states = rng.integers(0, sampler.n_states, size=50)
+    us = rng.random((99, 50))
+    trajs_numpy = kernels.trajs_from_tables(
+        sampler.cols, sampler.cdf, start_states, us, backend='numpy')
+    trajs_numba = kernels.trajs_from_tables(
+        sampler.cols, sampler.cdf, start_states, us, backend='numba')
+    assert np.all(trajs_numpy == trajs_numba)
+
+
+def test_counts_match_between_backends():
+    sampler = TransitionSampler(_random_T())
+    trajs = sampler.trajs(
+        100, np.zeros(50, dtype=int), rng=np.random.default_rng(42))
+    # negative frames are missing data
+    trajs[:5, 60:] = -1
+    for lag_time in [1, 3]:
+        C_numpy = kernels.transition_counts(
+            trajs, sampler.n_states, lag_time=lag_time, backend='numpy')
+        C_numba = kernels.transition_counts(
+            trajs, sampler.n_states, lag_time=lag_time, backend='numba')
+        assert np.all(C_numpy.toarray() == C_numba.toarray())
+    observed_numpy = kernels.observed_states(
+        trajs, sampler.n_states, backend='numpy')
+    observed_numba = kernels.observed_states(
+        trajs, sampler.n_states, backend='numba')
+    assert np.all(observed_numpy == observed_numba)
+
+
+def test_trajs_statistics_match_between_backends():
+    T = spar.csr_matrix(np.array([
+        [0.5, 0.5, 0.0, 0.0],
+        [0.2, 0.5, 0.3, 0.0],
+        [0.0, 0.3, 0.5, 0.2],
+        [0.0, 0.0, 0.5, 0.5]]))
+    sampler = TransitionSampler(T)
+    C = {}
+    for backend in ['numpy', 'numba']:
+        kernels.set_backend(backend)
+        try:
+            trajs = sampler.trajs(
+                2000, np.zeros(20, dtype=int),
+                rng=np.random.default_rng(7))
+        finally:
+            kernels.set_backend('auto')
+        C[backend] = kernels.transition_counts(trajs, 4).toarray()
+    assert np.all(C['numpy'] == C['numba'])
+    # both recover T from the counts
+    T_est = C['numpy'] / C['numpy'].sum(axis=1)[:, None]
+    assert np.allclose(T_est, T.toarray(), atol=0.05)
@@ -0,0 +1,50 @@
+import numpy as np
+import os
+import pytest
+from slandscapes import landscapes, special_landscapes
+from slandscapes.mc_sampling import adaptive_sampling
+
+
+def test_save_defaults_to_h5(tmp_path):
+    pytest.importorskip('mdtraj')
+    l = special_landscapes.funneled_landscape((6, 6))
+    output_name = str(tmp_path / 'landscape')
+    l.save(output_name)
+    assert os.path.isfile(output_name)
+    assert np.all(landscapes.landscape.load(output_name).values == l.values)
+
+
+def test_native_save_and_load_probs(tmp_path):
+    l = special_landscapes.funneled_landscape((6, 6))
+    output_name = str(tmp_path / 'landscape')
+    l.save(output_name, native=True, probs=True)
+    assert os.path.isdir(output_name)
+    l_loaded = landscapes.landscape.load(output_name)
+    assert np.all(l_loaded.values == l.values)
+    assert np.all(l_loaded.x1_coords == l.x1_coords)
+    T = landscapes.load_probs(output_name)
+    assert np.allclose(T.toarray(), l.to_probs(sparse=True).toarray())
+    # the memory-mapped matrix is read-only and can be sampled directly
+    assignments = adaptive_sampling(
+        T, n_runs=3, n_clones=2, n_steps=5, n_reps=2, seed=0,
+        executor='serial')
+    assert assignments.shape == (2, 3, 2, 6)
+
+
+def test_probs_need_native_format(tmp_path):
+    l = special_landscapes.funneled_landscape((6, 6))
+    with pytest.raises(ValueError):
+        l.save(str(tmp_path / 'landscape.h5'), probs=True)
+
+
+@pytest.mark.parametrize('grid_size', [(5, 1), (1, 4), (1, 1)])
+def test_native_save_single_point_axis(tmp_path, grid_size):
+    l = landscapes.landscape(grid_size=grid_size)
+    l.values = np.random.default_rng(0).random(l.values.shape)
+    output_name = str(tmp_path / 'landscape')
+    l.save(output_name, native=True)
+    l_loaded = landscapes.landscape.load(output_name)
+    assert l_loaded.grid_size == grid_size
+    assert np.all(l_loaded.values == l.values)
+    assert np.all(l_loaded.x1_coords == l.x1_coords)
+    assert np.all(l_loaded.x2_coords == l.x2_coords)
@@ -0,0 +1,15 @@
+import numpy as np
+from slandscapes import mc_analysis
+
+
+def test_discover_probabilities_compact_assignments():
+    # state 127 is the largest int8, so n_states does not fit in int8
+    assignments = np.array([[0, 1, 127, -1], [0, 5, 6, 7]], dtype=np.int8)
+    discover_probs = mc_analysis.discover_probabilities(assignments)
+    assert discover_probs.shape == (128, )
+    assert discover_probs[0] == 1
+    assert discover_probs[127] == 0.5
+    discover_probs = mc_analysis.discover_probabilities(
+        assignments, end_state=127)
+    assert discover_probs.shape == (128, )
+    assert np.all(discover_probs[[5, 6, 7]] == 0.5)
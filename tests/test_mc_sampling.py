@@ -0,0 +1,95 @@
+import numpy as np
+import os
+import pytest
+import scipy.sparse as spar
+from slandscapes import mc_sampling
+from slandscapes.mc_sampling import TransitionSampler, adaptive_sampling
+
+
+def _grid_T():
+    T = np.array([
+        [0.5, 0.5, 0.0],
+        [0.25, 0.5, 0.25],
+        [0.0, 0.5, 0.5]])
+    return T
+
+
+def test_sampler_leaves_input_unchanged():
+    T = spar.csr_matrix(_grid_T())
+    # an explicit zero and unsorted indices need to be cleaned up
+    T.data[0] = 0
+    T.indices[[2, 3]] = T.indices[[3, 2]]
+    T.data[[2, 3]] = T.data[[3, 2]]
+    T.has_sorted_indices = False
+    data, indices = T.data.copy(), T.indices.copy()
+    TransitionSampler(T)
+    assert np.all(T.data == data)
+    assert np.all(T.indices == indices)
+
+
+def test_sampler_read_only_input():
+    T = spar.csr_matrix(_grid_T())
+    for array in [T.data, T.indices, T.indptr]:
+        array.flags.writeable = False
+    sampler = TransitionSampler(T)
+    assert sampler.n_states == 3
+    T = spar.csr_matrix(T)
+    T.data = np.array(T.data)
+    T.data[0] = 0
+    T.data.flags.writeable = False
+    TransitionSampler(T)
+
+
+def test_checkpoint_single_run(tmp_path):
+    T = _grid_T()
+    assignments = adaptive_sampling(
+        T, n_runs=1, n_clones=2, n_steps=5, n_reps=2, seed=0,
+        executor='serial', checkpoint_dir=str(tmp_path))
+    assert assignments.shape == (2, 1, 2, 6)
+    # finished reps are loaded on a second call
+    assert np.all(
+        adaptive_sampling(
+            T, n_runs=1, n_clones=2, n_steps=5, n_reps=2, seed=0,
+            executor='serial', checkpoint_dir=str(tmp_path)) == assignments)
+
+
+def test_checkpoint_resume(tmp_path, monkeypatch):
+    T = _grid_T()
+    kwargs = dict(
+        n_runs=6, n_clones=2, n_steps=5, n_reps=2, seed=0,
+        executor='serial', checkpoint_interval=2)
+    assignments = adaptive_sampling(T, **kwargs)
+    # the first rep finishes, and the second is interrupted after
+    # checkpointing its fourth round
+    select_states = mc_sampling._select_states
+    calls = []
+
+    def interrupted_select_states(*args, **kwargs):
+        calls.append(1)
+        if len(calls) > 9:
+            raise KeyboardInterrupt
+        return select_states(*args, **kwargs)
+
+    with monkeypatch.context() as m:
+        m.setattr(mc_sampling, '_select_states', interrupted_select_states)
+        with pytest.raises(KeyboardInterrupt):
+            adaptive_sampling(T, checkpoint_dir=str(tmp_path), **kwargs)
+    assert os.path.exists(tmp_path / 'rep000000.npy')
+    assert os.path.exists(tmp_path / 'rep000001.pkl')
+    resumed = adaptive_sampling(T, checkpoint_dir=str(tmp_path), **kwargs)
+    assert np.all(resumed == assignments)
+
+
+def test_checkpoint_different_call(tmp_path):
+    T = _grid_T()
+    kwargs = dict(n_clones=2, n_reps=2, executor='serial')
+    adaptive_sampling(
+        T, n_runs=2, n_steps=5, seed=0, checkpoint_dir=str(tmp_path),
+        **kwargs)
+    for parameters in [
+            dict(n_runs=3, n_steps=5, seed=0),
+            dict(n_runs=2, n_steps=4, seed=0),
+            dict(n_runs=2, n_steps=5, seed=1)]:
+        with pytest.raises(ValueError):
+            adaptive_sampling(
+                T, checkpoint_dir=str(tmp_path), **parameters, **kwargs)
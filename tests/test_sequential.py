@@ -0,0 +1,32 @@
+import numpy as np
+from slandscapes.mc_sampling import TransitionSampler
+from slandscapes.sequential import sequential_adaptive_sampling
+
+T = np.array([
+    [0.8, 0.2, 0.0, 0.0],
+    [0.2, 0.6, 0.2, 0.0],
+    [0.0, 0.2, 0.6, 0.2],
+    [0.0, 0.0, 0.2, 0.8]])
+KWARGS = dict(
+    estimate='probability', ci_width=0.3, batch_size=10, max_reps=40,
+    seed=0, n_runs=3, n_clones=2, n_steps=3, executor='serial')
+
+
+def test_sequential_with_sampler(monkeypatch):
+    value, interval, discoveries = sequential_adaptive_sampling(
+        T, 3, **KWARGS)
+    # the sampling tables are only built once, not for every batch
+    n_builds = []
+    build = TransitionSampler.__init__
+
+    def counted_build(self, *args, **kwargs):
+        n_builds.append(1)
+        build(self, *args, **kwargs)
+
+    monkeypatch.setattr(TransitionSampler, '__init__', counted_build)
+    sampler_value, sampler_interval, sampler_discoveries = \
+        sequential_adaptive_sampling(TransitionSampler(T), 3, **KWARGS)
+    assert len(n_builds) == 1
+    assert value == sampler_value
+    assert np.all(discoveries == sampler_discoveries)
+    assert len(discoveries) > 10
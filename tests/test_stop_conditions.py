@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from slandscapes import mc_sampling, stop_conditions
+from slandscapes.mc_sampling import adaptive_sampling
+
+
+def test_target_states_earliest_hit():
+    stop_condition = stop_conditions.target_states(9)
+    trajs = np.array([[0, 1, 2, 3, 9], [0, 9, 1, 1, 1], [0, 9, 9, 1, 1]])
+    assert stop_condition.check(trajs) == (1, 1)
+    assert stop_condition.check(trajs[:, :1]) is None
+
+
+def test_stop_in_initial_round(tmp_path):
+    T = np.array([
+        [0.5, 0.5, 0.0],
+        [0.25, 0.5, 0.25],
+        [0.0, 0.5, 0.5]])
+    # the initial state is the target, so every rep stops right away
+    assignments, discoveries = adaptive_sampling(
+        T, initial_state=0, n_runs=3, n_clones=2, n_steps=5, n_reps=2,
+        seed=0, executor='serial', checkpoint_dir=str(tmp_path),
+        stop_condition=stop_conditions.target_states(0))
+    assert np.all(discoveries == [[0, 0, 0], [0, 0, 0]])
+    assert np.all(assignments[:, 1:] == -1)
+
+
+def _never(msm):
+    return False
+
+
+def _interrupted(monkeypatch, n_calls):
+    """Makes state selection raise after `n_calls` calls."""
+    select_states = mc_sampling._select_states
+    calls = []
+
+    def interrupted_select_states(*args, **kwargs):
+        calls.append(1)
+        if len(calls) > n_calls:
+            raise KeyboardInterrupt
+        return select_states(*args, **kwargs)
+
+    monkeypatch.setattr(
+        mc_sampling, '_select_states', interrupted_select_states)
+
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_resume_with_counts_predicate(tmp_path, monkeypatch, incremental):
+    T = np.array([
+        [0.5, 0.5, 0.0],
+        [0.25, 0.5, 0.25],
+        [0.0, 0.5, 0.5]])
+    kwargs = dict(
+        n_runs=6, n_clones=2, n_steps=5, n_reps=1, seed=0,
+        executor='serial', incremental=incremental,
+        stop_condition=stop_conditions.counts_predicate(_never))
+    assignments, discoveries = adaptive_sampling(T, **kwargs)
+    with monkeypatch.context() as m:
+        _interrupted(m, 3)
+        with pytest.raises(KeyboardInterrupt):
+            adaptive_sampling(
+                T, checkpoint_dir=str(tmp_path), checkpoint_interval=1,
+                **kwargs)
+    resumed, resumed_discoveries = adaptive_sampling(
+        T, checkpoint_dir=str(tmp_path), checkpoint_interval=1, **kwargs)
+    assert np.all(resumed == assignments)
+    assert np.all(resumed_discoveries == discoveries)